@@ -0,0 +1,73 @@
+"""
+Compares the full-corpus load time of the legacy str(list)/eval() encoding of links and
+publications with the JSON encoding, on copies of profiles.db.
+
+Run from the repository root:
+
+    python -m benchmarks.corpus_load
+"""
+# Internal imports
+import os
+import shutil
+import sqlite3
+import asyncio
+import tempfile
+import statistics
+import time
+
+# Local imports
+from src.Profile import Profile
+from src.Database import Database
+
+REPEATS = 20
+
+
+def load_legacy(db_name: str) -> list[Profile]:
+    """The loader before the migration: eval() on every links and publications cell."""
+    with sqlite3.connect(db_name) as conn:
+        profiles = []
+        for row in conn.execute('SELECT * FROM profiles').fetchall():
+            profile_data = {
+                'name': row[0],
+                'department': row[2],
+                'contact': row[3],
+                'location': row[4],
+                'links': eval(row[5]),
+                'summary': row[6],
+                'publications': eval(row[7])
+            }
+            profiles.append(Profile(url=row[1], **profile_data))
+        return profiles
+
+
+def timeit(function, *args) -> tuple[float, float]:
+    """Returns the median and best time of `function(*args)` in milliseconds."""
+    timings = []
+    for _ in range(REPEATS):
+        start = time.perf_counter()
+        function(*args)
+        timings.append((time.perf_counter() - start) * 1000)
+    return statistics.median(timings), min(timings)
+
+
+async def main():
+    with tempfile.TemporaryDirectory() as directory:
+        legacy_path = os.path.join(directory, 'legacy.db')
+        json_path = os.path.join(directory, 'json.db')
+        shutil.copy('profiles.db', legacy_path)
+        shutil.copy('profiles.db', json_path)
+
+        db = Database(json_path)
+        await db.create_table()  # Migrates the copy to JSON
+        assert [p.to_dict() for p in load_legacy(legacy_path)] == [p.to_dict() for p in db._sync_get_profiles()]
+
+        legacy = timeit(load_legacy, legacy_path)
+        migrated = timeit(db._sync_get_profiles)
+        print(f"{'encoding':<10}{'median ms':>12}{'best ms':>12}{'file KiB':>12}")
+        print(f"{'eval':<10}{legacy[0]:>12.1f}{legacy[1]:>12.1f}{os.path.getsize(legacy_path) / 1024:>12.0f}")
+        print(f"{'json':<10}{migrated[0]:>12.1f}{migrated[1]:>12.1f}{os.path.getsize(json_path) / 1024:>12.0f}")
+        print(f"speed-up: {legacy[0] / migrated[0]:.1f}x")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,84 @@
+"""
+Compares the encoder backends: query-encoding latency, bulk corpus-encoding throughput,
+and cosine agreement with the fp32 embeddings, on the profiles in profiles.db.
+
+Run from the repository root:
+
+    python -m benchmarks.encoder [model name or path]
+"""
+# Internal imports
+import os
+import sys
+import shutil
+import tempfile
+import statistics
+import time
+
+# External imports
+import torch
+
+# Local imports
+from src.Corpus import Corpus
+from src.Database import Database
+from src.Encoder import Encoder, ONNX_AVAILABLE
+
+QUERIES = ["machine learning for healthcare", "fluid dynamics", "catalysis and green chemistry",
+           "robotics", "quantum computing", "structural engineering of bridges"]
+REPEATS = 50
+BATCH_SIZE = 32
+
+
+def load_documents() -> list[str]:
+    """Returns the profile texts of a copy of profiles.db."""
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'profiles.db')
+        shutil.copy('profiles.db', path)
+        return Corpus(Database(path)._sync_get_profiles()).documents
+
+
+def query_latency(encoder: Encoder) -> tuple[float, float]:
+    """Returns the median and p95 milliseconds to encode one query."""
+    timings = []
+    for repeat in range(REPEATS):
+        start = time.perf_counter()
+        encoder.encode([QUERIES[repeat % len(QUERIES)]])
+        timings.append((time.perf_counter() - start) * 1000)
+    timings.sort()
+    return statistics.median(timings), timings[int(0.95 * (len(timings) - 1))]
+
+
+def throughput(encoder: Encoder, documents: list[str]) -> float:
+    """Returns the documents encoded per second, in batches."""
+    start = time.perf_counter()
+    for offset in range(0, len(documents), BATCH_SIZE):
+        encoder.encode(documents[offset:offset + BATCH_SIZE])
+    return len(documents) / (time.perf_counter() - start)
+
+
+def main(model_name: str):
+    documents = load_documents()
+    print(f"{model_name}, {len(documents)} profiles, {torch.get_num_threads()} threads")
+    with tempfile.TemporaryDirectory() as directory:
+        start = time.perf_counter()
+        reference = Encoder(model_name, backend='torch')
+        reference_load = time.perf_counter() - start
+        backends = [backend for backend in Encoder.BACKENDS if backend != 'onnx' or ONNX_AVAILABLE]
+        print(f"{'backend':<8}{'load s':>8}{'query ms':>10}{'p95 ms':>8}{'docs/s':>9}{'mean cos':>10}{'min cos':>9}")
+        for backend in backends:
+            if backend == 'torch':
+                encoder, load = reference, reference_load
+            else:
+                start = time.perf_counter()
+                encoder = Encoder(model_name, backend=backend, onnx_path=os.path.join(directory, 'encoder.onnx'))
+                load = time.perf_counter() - start
+            encoder.encode(["warm up"])
+            median, p95 = query_latency(encoder)
+            rate = throughput(encoder, documents)
+            cosines = encoder.agreement(reference, documents)
+            print(f"{backend:<8}{load:>8.2f}{median:>10.2f}{p95:>8.2f}{rate:>9.0f}{cosines.mean():>10.4f}{cosines.min():>9.4f}")
+        if not ONNX_AVAILABLE:
+            print("onnx skipped: onnxruntime is not installed")
+
+
+if __name__ == "__main__":
+    main(sys.argv[1] if len(sys.argv) > 1 else 'sentence-transformers/all-MiniLM-L6-v2')
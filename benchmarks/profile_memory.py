@@ -0,0 +1,99 @@
+"""
+Compares the memory use and text rendering time of the slotted Profile with the previous
+dict-backed Profile, on the profiles of profiles.db repeated to a larger corpus.
+
+Run from the repository root:
+
+    python -m benchmarks.profile_memory [copies]
+"""
+# Internal imports
+import os
+import sys
+import gc
+import shutil
+import hashlib
+import tempfile
+import time
+import tracemalloc
+
+# Local imports
+from src.Corpus import Corpus
+from src.Database import Database
+from src.Profile import Profile
+
+RENDERS = 3  # str(profile) calls per profile and corpus version: documents, content hash, writer length
+
+
+class DictProfile:
+    """The previous Profile layout: a per-instance dict, and the text rebuilt on every str()."""
+
+    def __init__(self, url: str, **profile_data) -> None:
+        self.url = url
+        self.__data = {'name': 'N/A', 'department': 'N/A', 'contact': 'N/A', 'location': 'N/A',
+                       'links': [], 'summary': 'N/A', 'publications': [], 'url': url}
+        self.__data.update(profile_data)
+
+    def get_data(self, *args: str):
+        return self.__data[args[0]] if len(args) == 1 else self.__data
+
+    def content_hash(self) -> str:
+        return hashlib.sha1(str(self).encode('utf-8')).hexdigest()
+
+    def __str__(self) -> str:
+        profile_str: str = f"Name: {self.__data['name']}, "
+        profile_str += f"Department: {self.__data['department']}, "
+        profile_str += f"Contact: {self.__data['contact']}, "
+        profile_str += f"Location: {self.__data['location']}, "
+        profile_str += f"Links: {', '.join(self.__data['links'])}, "
+        profile_str += f"Summary: {self.__data['summary']}, "
+        profile_str += f"Publications: {', '.join(self.__data['publications'])}"
+        return profile_str
+
+
+def load_rows() -> list[dict]:
+    """Returns the profile data of a copy of profiles.db."""
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'profiles.db')
+        shutil.copy('profiles.db', path)
+        return [profile.to_dict() for profile in Database(path)._sync_get_profiles()]
+
+
+def build(cls: type, rows: list[dict], copies: int) -> list:
+    """Builds the profiles as the database does, with fresh strings for every row."""
+    profiles = []
+    for copy in range(copies):
+        for row in rows:
+            data = {key: (list(map(str.strip, value)) if isinstance(value, list) else f" {value}".strip())
+                    for key, value in row.items() if key != 'url'}
+            profiles.append(cls(url=f"{row['url']}/{copy}", **data))
+    return profiles
+
+
+def measure(cls: type, rows: list[dict], copies: int) -> tuple[float, float, float]:
+    """Returns the MB taken by the profiles, the MB taken by them and their corpus, and the corpus build seconds."""
+    gc.collect()
+    tracemalloc.start()
+    profiles = build(cls, rows, copies)
+    objects = tracemalloc.get_traced_memory()[0]
+    start = time.perf_counter()
+    corpus = Corpus(profiles)  # Renders every profile for its document and its content hash
+    for profile in profiles:
+        len(str(profile))  # The profile writer's length check
+    seconds = time.perf_counter() - start
+    total = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del corpus, profiles
+    return objects / 2 ** 20, total / 2 ** 20, seconds
+
+
+def main(copies: int):
+    rows = load_rows()
+    print(f"{len(rows) * copies} profiles ({len(rows)} x {copies}), {RENDERS} renders per profile")
+    print(f"{'profile':<14}{'objects MB':>12}{'+ corpus MB':>13}{'corpus s':>10}")
+    for cls in (DictProfile, Profile):
+        objects, total, seconds = measure(cls, rows, copies)
+        print(f"{cls.__name__:<14}{objects:>12.1f}{total:>13.1f}{seconds:>10.3f}")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 20)
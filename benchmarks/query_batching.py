@@ -0,0 +1,66 @@
+"""
+Compares query embedding with one forward pass per query against the micro-batching
+QueryBatcher, at 1, 8 and 32 concurrent clients.
+
+Run from the repository root:
+
+    python -m benchmarks.query_batching [model name or path]
+"""
+# Internal imports
+import sys
+import time
+import asyncio
+import statistics
+
+# External imports
+import numpy as np
+
+# Local imports
+from src.Encoder import Encoder
+from src.QueryBatcher import QueryBatcher
+
+CLIENTS = (1, 8, 32)
+QUERIES_PER_CLIENT = 20
+TOPICS = ["machine learning", "fluid dynamics", "catalysis", "robotics", "quantum computing", "bridges",
+          "tissue engineering", "climate modelling", "power electronics", "combustion", "graph theory"]
+
+
+async def direct(encoder: Encoder, text: str) -> np.ndarray:
+    """The path before batching: one executor call and forward pass per query."""
+    return (await asyncio.get_running_loop().run_in_executor(None, encoder.encode, [text]))[0]
+
+
+async def client(embed, number: int, latencies: list[float]):
+    """Sends queries one after the other, like a user of the search endpoint."""
+    for query in range(QUERIES_PER_CLIENT):
+        text = f"{TOPICS[(number + query) % len(TOPICS)]} {number} {query}"  # Distinct texts, so nothing is deduplicated
+        start = time.perf_counter()
+        await embed(text)
+        latencies.append((time.perf_counter() - start) * 1000)
+
+
+async def run(embed, clients: int) -> tuple[float, float, float]:
+    """Returns the queries per second and the median and p95 latency in milliseconds."""
+    latencies: list[float] = []
+    start = time.perf_counter()
+    await asyncio.gather(*(client(embed, number, latencies) for number in range(clients)))
+    elapsed = time.perf_counter() - start
+    latencies.sort()
+    return len(latencies) / elapsed, statistics.median(latencies), latencies[int(0.95 * (len(latencies) - 1))]
+
+
+async def main(model_name: str):
+    encoder = Encoder(model_name)
+    encoder.encode(["warm up"])
+    print(f"{model_name}, {QUERIES_PER_CLIENT} queries per client")
+    print(f"{'clients':<9}{'mode':<9}{'queries/s':>11}{'median ms':>11}{'p95 ms':>9}{'batch':>7}")
+    for clients in CLIENTS:
+        rate, median, p95 = await run(lambda text: direct(encoder, text), clients)
+        print(f"{clients:<9}{'direct':<9}{rate:>11.1f}{median:>11.2f}{p95:>9.2f}{1.0:>7.1f}")
+        batcher = QueryBatcher(encoder.encode)
+        rate, median, p95 = await run(batcher.embed, clients)
+        print(f"{clients:<9}{'batched':<9}{rate:>11.1f}{median:>11.2f}{p95:>9.2f}{batcher.stats()['mean_batch_size']:>7.1f}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main(sys.argv[1] if len(sys.argv) > 1 else 'sentence-transformers/all-MiniLM-L6-v2'))
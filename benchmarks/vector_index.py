@@ -0,0 +1,70 @@
+"""
+Compares the recall and latency of the approximate IVF vector index with exact search,
+on a synthetic clustered corpus of unit vectors the size of MiniLM embeddings.
+
+Run from the repository root:
+
+    python -m benchmarks.vector_index [rows]
+"""
+# Internal imports
+import sys
+import time
+import statistics
+
+# External imports
+import numpy as np
+
+# Local imports
+from src.VectorIndex import VectorIndex
+
+DIM = 384  # all-MiniLM-L6-v2 embedding size
+TOPICS = 2000  # Clusters in the synthetic corpus
+QUERIES = 200
+K = 10
+
+
+def normalise(vectors: np.ndarray) -> np.ndarray:
+    return (vectors / np.linalg.norm(vectors, axis=-1, keepdims=True)).astype(np.float32)
+
+
+def synthetic_corpus(rows: int, rng: np.random.Generator) -> tuple[np.ndarray, np.ndarray]:
+    """Returns unit vectors scattered around random topics, and queries near random rows."""
+    topics = normalise(rng.standard_normal((TOPICS, DIM)))
+    matrix = normalise(topics[rng.integers(0, TOPICS, rows)] + 0.05 * rng.standard_normal((rows, DIM)))
+    queries = normalise(matrix[rng.integers(0, rows, QUERIES)] + 0.05 * rng.standard_normal((QUERIES, DIM)))
+    return matrix, queries
+
+
+def run(index: VectorIndex, queries: np.ndarray) -> tuple[list[set], float, float]:
+    """Returns the top-K rows of every query, and the median and p95 latency in milliseconds."""
+    results, timings = [], []
+    for query in queries:
+        start = time.perf_counter()
+        indices, _ = index.search(query, K)
+        timings.append((time.perf_counter() - start) * 1000)
+        results.append(set(indices.tolist()))
+    return results, statistics.median(timings), float(np.percentile(timings, 95))
+
+
+def main(rows: int):
+    rng = np.random.default_rng(0)
+    matrix, queries = synthetic_corpus(rows, rng)
+    print(f"{rows} rows, {DIM} dimensions, {QUERIES} queries, recall@{K}")
+
+    exact = VectorIndex.create('exact', matrix)
+    truth, median, p95 = run(exact, queries)
+    print(f"{'index':<16}{'build s':>10}{'recall':>10}{'median ms':>12}{'p95 ms':>10}")
+    print(f"{'exact':<16}{0.0:>10.2f}{1.0:>10.3f}{median:>12.3f}{p95:>10.3f}")
+
+    start = time.perf_counter()
+    ivf = VectorIndex.create('ivf', matrix)
+    build = time.perf_counter() - start
+    for probes in (1, 4, 8, 16, 32):
+        ivf.probes = probes
+        found, median, p95 = run(ivf, queries)
+        recall = statistics.mean(len(result & expected) / K for result, expected in zip(found, truth))
+        print(f"{f'ivf probes={probes}':<16}{build:>10.2f}{recall:>10.3f}{median:>12.3f}{p95:>10.3f}")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 100_000)
@@ -1,4 +1,5 @@
 import io
+import json
 import streamlit as st
 import streamlit_scrollable_textbox as stx
 import requests
@@ -37,14 +38,16 @@ st.title("🎓Imperial College Staff Finder")
 # Search bar
 query = st.text_input("Enter topics you're looking for:")
 
-col1, col2, col3 = st.columns([1,1,1])
+col0, col1, col2, col3 = st.columns([1,1,1,1])
 # Search button
+with col0:
+    instant_search_button = st.button("Instant Search", disabled=False, use_container_width=True)
 with col1:
     quick_search_button = st.button("Quick Search", disabled=False, use_container_width=True)
 with col2:
     norm_search_button = st.button("Normal Search", disabled=False, use_container_width=True)
 with col3:
-    long_search_button = st.button("Long Search", disabled=True, use_container_width=True)
+    long_search_button = st.button("Long Search", disabled=False, use_container_width=True)
 
 # Define a placeholder for search results right after the search bar
 search_results_placeholder = st.empty()
@@ -70,18 +73,30 @@ def display_placeholders():
 
             st.markdown("---")
 
+# Portraits are fetched once, not on every refinement of the results
+@st.cache_data(show_spinner=False)
+def get_portrait(url: str) -> bytes:
+    """Download the portrait of a profile."""
+    return requests.get(f"{url}/portrait.jpg").content
+
 # Function to display actual profiles
-def display_profiles(profiles: list[dict]):
+def display_profiles(profiles: list[dict], render: int = 0, status: str | None = None):
     """Display the actual profiles fetched from the FastAPI server.
 
     Parameters
     ----------
     profiles : list[dict]
         The list of profiles to display.
+    render : int
+        The number of times the results were already drawn in this run, to keep widget keys unique.
+    status : str | None
+        A caption shown above the profiles, e.g. while the ranking is being refined.
     """
     search_results_placeholder.empty()  # Clear the placeholders
     
     with search_results_placeholder.container():
+        if status:
+            st.caption(status)
         # Display each profile. They have the same structure as the placeholder
         ids: list[str] = []
         for profile in profiles:
@@ -97,7 +112,7 @@ def display_profiles(profiles: list[dict]):
                 if 'url' in profile and profile['url']:
 
                     try:
-                        img_data = requests.get(f"{profile['url']}/portrait.jpg").content
+                        img_data = get_portrait(profile['url'])
                         with io.BytesIO(img_data) as f: # Open a file-like buffer
                             f.seek(0)
                             st.image(f, width=150, use_column_width=True)
@@ -118,52 +133,69 @@ def display_profiles(profiles: list[dict]):
                 st.markdown(f"**Department:** {profile.get('department', 'N/A')}")
                 st.markdown(f"**Contact:** {profile.get('contact', 'N/A')}")
                 st.markdown(f"**Summary:**")
-                stx.scrollableTextbox(profile.get('summary', 'N/A'), height=250, border=False, key=id)
+                stx.scrollableTextbox(profile.get('summary', 'N/A'), height=250, border=False, key=f"{id}_{render}")
                 
             st.markdown("---")  # Horizontal line for separation
 
-# Function to send POST request to the FastAPI server
-def get_profiles(query: str, method: str = "/norm") -> list[dict] | None:
-    """Send a POST request to the FastAPI server to retrieve profiles based on the query.
-    
+# Function to stream rankings from the FastAPI server
+def stream_profiles(query: str, method: str = "/norm"):
+    """Send a POST request to the FastAPI server and yield each ranking as it is refined.
+
+    The server sends one JSON ranking per line, as each ranking stage finishes.
+
     Parameters
     ----------
     query : str
         The query to search for.
-        
-    Returns
-    -------
-    list[dict] | None
-        A list of profiles if the request is successful, otherwise None.
+    method : str
+        The search mode endpoint, e.g. "/norm".
+
+    Yields
+    ------
+    dict
+        A ranking with its `profiles`, the `stage` that produced it and whether it is `final`.
     """
     try:
-        response = requests.post(ENDPOINT+method, json={"query": query})   # Send POST request
-        if response.status_code == 200:                             # Check if the request is successful
-            return response.json()['profiles']
+        with requests.post(ENDPOINT+method+"/stream", json={"query": query}, stream=True) as response:   # Send POST request
+            if response.status_code != 200:                             # Check if the request is successful
+                logging.error(f"Failed to retrieve profiles: HTTP {response.status_code}")
+                return
+            for line in response.iter_lines():
+                if line:
+                    event = json.loads(line)
+                    if event.get('code') != 200:
+                        logging.error(f"Failed to retrieve profiles: {event.get('error')}")
+                        return
+                    yield event
 
     except Exception as e:
         logging.error(f"Failed to retrieve profiles: {e}")
-        pass
-
-    search_results_placeholder.empty()
-    return None
 
 # Search button
-if quick_search_button or norm_search_button or long_search_button:
+if instant_search_button or quick_search_button or norm_search_button or long_search_button:
     # Display placeholders initially
     display_placeholders()
 
     # Determine the search method based on the button clicked
-    if quick_search_button:
+    if instant_search_button:
+        method = "/fts"
+    elif quick_search_button:
         method = "/quick"
     elif norm_search_button:
         method = "/norm"
     elif long_search_button:
         method = "/long"
     
-    # Fetch and display actual profiles
-    profiles = get_profiles(query, method=method)
-    if profiles:
-        display_profiles(profiles)
+    # Display each ranking as soon as it arrives, refining it as the slower stages finish
+    final = None
+    for render, event in enumerate(stream_profiles(query, method=method)):
+        if event['final']:
+            final = event
+        elif event['profiles']:
+            display_profiles(event['profiles'], render, status=f"Ranked by {', '.join(event['stages'])}, refining...")
+    if final and final['profiles']:
+        missed = final.get('missed_stages')
+        display_profiles(final['profiles'], render + 1, status=f"Skipped {', '.join(missed)}" if missed else None)
     else:
+        search_results_placeholder.empty()
         st.error("Failed to retrieve profiles. Please try again.")
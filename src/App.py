@@ -0,0 +1,197 @@
+"""
+The backend application: the FastAPI app, the search engine it serves and the crawl that
+keeps the profiles up to date. Started by backend.py.
+"""
+# Internal imports
+import os
+import asyncio
+import logging
+from enum import Enum
+import threading
+import traceback
+import multiprocessing
+from collections import Counter
+from concurrent.futures import Executor, ProcessPoolExecutor
+
+# External imports
+from fastapi import FastAPI
+from contextlib import asynccontextmanager
+import dotenv
+
+# Local imports
+from src.Scraper import Scraper
+from src.CrawlScheduler import CrawlScheduler
+from src.Profile import Profile
+from src.Database import Database
+from src.ProfileWriter import ProfileWriter
+from src.HttpClient import HttpClient
+from src.LoggerFormatter import CustomFormatter
+from src.Router import Router
+from src.SearchEngine import SearchEngine
+
+__all__ = ['app']
+
+dotenv.load_dotenv(override=True)
+
+class AppMode(str, Enum):  # Enum for the application mode
+    STOPPED = "STOPPED"
+    RUNNING = "RUNNING"
+
+APP_MODE = AppMode.STOPPED
+
+# Function to start the asynchronous loop that scrapes and updates profiles
+def start_async_loop():
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    loop.run_until_complete(scrape_and_update())
+    loop.close()
+
+async def scrape_and_update(delay: float | None = None):
+    # Profile pages are parsed in worker processes, so parsing neither blocks the event loop nor holds the GIL
+    # Each worker is a whole interpreter, so a few are enough to keep up with the crawl budget
+    workers = int(os.getenv("PARSER_WORKERS", "0")) or min(4, os.cpu_count() or 1)
+    with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn")) as executor:
+        # One pooled HTTP client for the whole crawl
+        async with HttpClient(concurrency=int(os.getenv("SCRAPER_CONCURRENCY", "10")),
+                              timeout=float(os.getenv("SCRAPER_TIMEOUT", "20"))) as client:
+            await crawl(client, delay or float(os.getenv("DISCOVERY_INTERVAL", "3600")), executor)
+
+async def crawl(client: HttpClient, delay: float, executor: Executor | None = None):
+    """Refreshes the profile pages as the scheduler makes them due, within its requests-per-minute budget."""
+    # Create a Scraper and Database instance
+    scraper = Scraper(client)
+    db = Database("profiles.db")
+    await db.create_table() # Create the table if it doesn't exist
+
+    # Resume the schedule of the previous runs
+    scheduler = CrawlScheduler(requests_per_minute=float(os.getenv("CRAWL_RPM", "30")))
+    scheduler.load(await db.get_page_states(), set(await db.fetch_incomplete_urls()))
+    logging.info(f"Loaded the crawl schedule of {len(scheduler)} pages")
+    pages = Counter()  # Pages fetched, not modified (304), unchanged (same hash) and failed since the last discovery
+
+    # Scraped profiles and page states are written in batches, one transaction each
+    # A profile that fails to be written must not look unchanged at its next refresh
+    async with ProfileWriter(db, on_failure=scheduler.forget_content) as writer:
+        discovery = asyncio.create_task(discover(scraper, scheduler, writer, pages, delay))
+        tasks = set()
+        try:
+            while APP_MODE == AppMode.RUNNING:
+                url = scheduler.pop_due()
+                if url is None:
+                    # Nothing is due. Check again soon, for newly discovered pages and for shutdown
+                    await asyncio.sleep(min(scheduler.seconds_until_due(), 1.0))
+                    continue
+                # Spend one request of the budget
+                await asyncio.sleep(scheduler.throttle())
+                task = asyncio.create_task(refresh_profile(url, writer, client, scheduler, pages, executor))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+        finally:
+            discovery.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+async def discover(scraper: Scraper, scheduler: CrawlScheduler, writer: ProfileWriter, pages: Counter, delay: float):
+    """Adds the profile URLs of the listing pages to the schedule every `delay` seconds."""
+    while APP_MODE == AppMode.RUNNING:
+        logging.info("Scraping profiles")
+        try:
+            known = len(scheduler)
+            # New pages become due as soon as their listing page has been scraped
+            async for url in scraper.stream():
+                scheduler.add(url)
+            logging.info(f"Scraped the listing pages, {len(scheduler) - known} new of {len(scheduler)} pages")
+            scraper.log_stats()
+            logging.info(f"Since the last discovery: {pages['fetched']} pages fetched, {pages['not_modified']} not modified, "
+                         f"{pages['unchanged']} with unchanged content, {pages['failed']} failed")
+            logging.info(f"Wrote {writer.written} profiles, {writer.skipped} not longer than stored")
+            pages.clear()
+            logging.info(f"Waiting {delay} seconds")
+        except Exception as exc:
+            tb = traceback.format_exc()
+            logging.error(f"An error occurred: {exc}\nTraceback: {tb}")
+        # Wait for the specified delay
+        await asyncio.sleep(delay)
+
+async def refresh_profile(url: str, writer: ProfileWriter, client: HttpClient, scheduler: CrawlScheduler, pages: Counter,
+                          executor: Executor | None = None):
+    """Fetches a profile page conditionally, queues the profile if it changed and reschedules the page."""
+    page_state = scheduler.state(url) or None
+    try:
+        logging.info(f"Refreshing profile for {url}")
+        profile, new_state = await Profile.fetch(url, client, page_state, executor)
+    except Exception as exc:
+        # Error statuses such as 429 or 5xx raise too, so they back off instead of counting as a change
+        logging.warning(f"Profile refresh failed for {url}")
+        logging.error(exc)
+        pages['failed'] += 1
+        writer.submit_page_state(url, scheduler.record(url, None))
+        return
+
+    pages['fetched'] += 1
+    if profile is None:
+        # A 304 response hands back the previous state itself, a same-hash page a fresh one
+        pages['not_modified' if new_state is page_state else 'unchanged'] += 1
+        logging.info(f"Profile page unchanged: {url}")
+        writer.submit_page_state(url, scheduler.record(url, new_state))
+        return
+
+    profile_data = profile.to_dict()
+    incomplete = 'N/A' in (profile_data[key] for key in ('name', 'department', 'contact', 'location', 'summary'))
+    writer.submit_page_state(url, scheduler.record(url, new_state, changed=True, incomplete=incomplete))
+    # Queue the profile. It is only written if it is new or longer than the stored one
+    if await writer.submit(profile):
+        logging.info(f"Profile for {profile.get_data('name')} saved")
+
+async def load_engine(app: FastAPI):
+    """Creates the process-wide search engine and warms it, then publishes it on the app state."""
+    try:
+        db = Database()
+        await db.create_table()  # Create the tables if they don't exist
+        # Loading the models is blocking, so keep it off the event loop
+        loop = asyncio.get_running_loop()
+        vector_index = os.getenv("VECTOR_INDEX", "exact")
+        vector_index_params = {"probes": int(os.getenv("VECTOR_INDEX_PROBES", "8"))} if vector_index == "ivf" else None
+        engine = await loop.run_in_executor(None, lambda: SearchEngine(
+            db=db, open_ai_key=os.getenv("OPENAI_API_KEY"), tfidf_path=os.getenv("TFIDF_INDEX_PATH"),
+            persist_keywords=os.getenv("KEYWORD_CACHE_PERSIST", "0") == "1",
+            deadline=float(os.getenv("SEARCH_DEADLINE", "10")),
+            vector_index=vector_index, vector_index_params=vector_index_params,
+            encoder=os.getenv("ENCODER_BACKEND", "torch"),
+            response_cache_bytes=int(float(os.getenv("RESPONSE_CACHE_MB", "32")) * 1024 * 1024)))
+        await engine.warm_up()
+        app.state.engine = engine
+    except Exception as exc:
+        tb = traceback.format_exc()
+        logging.error(f"Search engine failed to load: {exc}\nTraceback: {tb}")
+
+# Asynchronous context manager for the application lifespan
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    logging.info("Starting up")
+    global APP_MODE
+    APP_MODE = AppMode.RUNNING
+
+    # Load the search engine in the background. /ready reports when it is done
+    app.state.engine = None
+    engine_task = asyncio.create_task(load_engine(app))
+    
+    # Create and start a new thread for scrape_and_update
+    scrape_thread = threading.Thread(target=lambda: asyncio.run(start_async_loop()), daemon=True)
+    scrape_thread.start()
+    
+    # Return control to the FastAPI app
+    yield
+    
+    APP_MODE = AppMode.STOPPED
+    engine_task.cancel()
+    logging.info("Waiting for the scraping thread to finish")
+    scrape_thread.join()  # Wait for the scrape_and_update thread to finish if it's still running
+    logging.info("Shutting down")
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logging.getLogger().handlers[0].setFormatter(CustomFormatter())
+
+# Create a FastAPI instance
+app = FastAPI(lifespan=lifespan)
+app.include_router(Router)
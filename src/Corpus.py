@@ -0,0 +1,40 @@
+# Internal imports
+import hashlib
+from functools import cached_property
+from typing import List
+
+# Local imports
+from .Profile import Profile
+
+__all__ = ['Corpus']
+
+
+class Corpus:
+    """
+    A snapshot of the profiles used by the rankers.
+
+    The document text and content hash of every profile are computed once, and the
+    version is a fingerprint of all (url, hash) pairs, so two snapshots with the same
+    content share the same version and indexes built for one are valid for the other.
+    The lower-cased documents are computed once, when a ranker first needs them.
+    """
+
+    def __init__(self, profiles: List[Profile]):
+        self.profiles: tuple[Profile, ...] = tuple(profiles)  # The profiles, in database order
+        self.urls: tuple[str, ...] = tuple(profile.get_data('url') for profile in self.profiles)
+        self.documents: tuple[str, ...] = tuple(str(profile) for profile in self.profiles)  # Text fed to the rankers
+        self.hashes: tuple[str, ...] = tuple(profile.content_hash() for profile in self.profiles)
+        self.positions: dict[str, int] = {url: index for index, url in enumerate(self.urls)}  # {url: row}
+
+        fingerprint = hashlib.sha1()
+        for url, content_hash in zip(self.urls, self.hashes):
+            fingerprint.update(f"{url}\0{content_hash}\n".encode('utf-8'))
+        self.version: str = fingerprint.hexdigest()  # Changes whenever a profile is added, removed or edited
+
+    @cached_property
+    def lowered(self) -> tuple[str, ...]:
+        """The documents in lower case, shared by the keyword matcher and the TF-IDF index."""
+        return tuple(document.lower() for document in self.documents)
+
+    def __len__(self) -> int:
+        return len(self.profiles)
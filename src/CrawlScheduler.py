@@ -0,0 +1,200 @@
+# Internal imports
+import time
+import heapq
+
+__all__ = ['CrawlScheduler']
+
+
+class CrawlScheduler:
+    """
+    Decides which profile page to refresh next, within a requests-per-minute budget.
+
+    Every page has a refresh interval that adapts to how often it changes: it halves when
+    a fetch finds new content and grows by half when the page is unchanged, between
+    `min_interval` and `max_interval`. Failed fetches, including HTTP error responses such
+    as 429 or 5xx, are retried with exponential backoff and leave the interval unchanged.
+    Among the pages that are due, pages never fetched successfully go first, then incomplete profiles
+    (with 'N/A' fields, whose interval is also capped at `incomplete_interval`), then the rest,
+    oldest due first.
+
+    The per-page state is a dict with the 'etag', 'last_modified' and 'content_hash' of the
+    last fetch plus 'last_fetch', 'last_change', 'failures' and 'interval'. It is what
+    `Database.get_page_states` returns and `Database.save_page_states` stores.
+    """
+    NEW, INCOMPLETE, KNOWN = 0, 1, 2  # Priorities, lowest first
+
+    def __init__(self, requests_per_minute: float = 30.0, min_interval: float = 3600.0,
+                 max_interval: float = 7 * 24 * 3600.0, incomplete_interval: float = 24 * 3600.0,
+                 retry_interval: float = 300.0):
+        self.requests_per_minute = requests_per_minute  # Budget of page fetches
+        self.min_interval = min_interval  # Seconds between refreshes of a page that keeps changing
+        self.max_interval = max_interval  # Seconds between refreshes of a stable page
+        self.incomplete_interval = incomplete_interval  # Longest interval of an incomplete profile
+        self.retry_interval = retry_interval  # First retry delay after a failure, doubled per failure
+        self.__states: dict[str, dict] = {}  # Page state, by URL
+        self.__incomplete: set[str] = set()  # URLs of profiles with 'N/A' fields
+        self.__heap: list[tuple[float, int, str]] = []  # (due time, priority, url) of the pages not due yet
+        self.__ready: list[tuple[int, float, str]] = []  # (priority, due time, url) of the due pages
+        self.__due: dict[str, float] = {}  # The current due time of every scheduled URL
+        self.__next_slot = 0.0  # Monotonic time the budget allows the next fetch at
+
+    def load(self, states: dict[str, dict], incomplete: set[str] | None = None):
+        """
+        Schedules the pages of a previous crawl.
+
+        Parameters
+        ----------
+        states : dict[str, dict]
+            The stored page states, by URL.
+        incomplete : set[str] | None
+            The URLs of the stored profiles with 'N/A' fields.
+        """
+        self.__incomplete = set(incomplete or ())
+        for url, state in states.items():
+            self.__states[url] = dict(state)
+            self.__schedule(url)
+
+    def add(self, url: str):
+        """Schedules a discovered page. A page not seen before is due now, with the highest priority."""
+        if url not in self.__states:
+            self.__states[url] = {}
+            self.__schedule(url)
+
+    def __len__(self) -> int:
+        return len(self.__states)
+
+    def state(self, url: str) -> dict:
+        """Returns the state of a page."""
+        return self.__states.get(url, {})
+
+    def priority(self, url: str) -> int:
+        """Returns the priority of a page, lowest first."""
+        # A content hash is only recorded by a successful fetch, so failed first fetches stay new
+        if not self.__states.get(url, {}).get('content_hash'):
+            return CrawlScheduler.NEW
+        return CrawlScheduler.INCOMPLETE if url in self.__incomplete else CrawlScheduler.KNOWN
+
+    def due_time(self, url: str) -> float:
+        """Returns the epoch time a page is due to be refreshed at."""
+        state = self.__states.get(url, {})
+        last_fetch = state.get('last_fetch')
+        if not last_fetch:
+            return 0.0
+        failures = state.get('failures') or 0
+        if failures:
+            return last_fetch + min(self.retry_interval * 2 ** (failures - 1), self.max_interval)
+        interval = state.get('interval') or self.min_interval
+        if url in self.__incomplete:
+            interval = min(interval, self.incomplete_interval)
+        return last_fetch + interval
+
+    def forget_content(self, urls: list[str]):
+        """
+        Drops the validators and content hash of pages whose profiles could not be written.
+
+        Their next fetch is then unconditional and parsed again, instead of being taken
+        for an unchanged page.
+        """
+        for url in urls:
+            if url in self.__states:
+                # A new dict, as the old one may be queued for writing with the profile
+                self.__states[url] = {key: value for key, value in self.__states[url].items()
+                                      if key not in ('etag', 'last_modified', 'content_hash')}
+
+    def __schedule(self, url: str):
+        due = self.due_time(url)
+        self.__due[url] = due
+        heapq.heappush(self.__heap, (due, self.priority(url), url))
+
+    def pop_due(self, now: float | None = None) -> str | None:
+        """
+        Returns the next page to refresh, or None if no page is due.
+
+        Due pages are taken by priority, then by due time. The page is not handed out
+        again until its fetch is recorded.
+        """
+        now = time.time() if now is None else now
+        # Move the entries that became due to the ready heap, ordered by priority
+        while self.__heap and self.__heap[0][0] <= now:
+            due, priority, url = heapq.heappop(self.__heap)
+            heapq.heappush(self.__ready, (priority, due, url))
+        while self.__ready:
+            priority, due, url = heapq.heappop(self.__ready)
+            # Skip the entries superseded by a later reschedule
+            if self.__due.get(url) == due:
+                del self.__due[url]
+                return url
+        return None
+
+    def seconds_until_due(self, now: float | None = None) -> float:
+        """Returns the seconds until the next page is due, or infinity if none is scheduled."""
+        now = time.time() if now is None else now
+        while self.__ready and self.__due.get(self.__ready[0][2]) != self.__ready[0][1]:
+            heapq.heappop(self.__ready)
+        if self.__ready:
+            return 0.0
+        while self.__heap and self.__due.get(self.__heap[0][2]) != self.__heap[0][0]:
+            heapq.heappop(self.__heap)
+        return max(self.__heap[0][0] - now, 0.0) if self.__heap else float('inf')
+
+    def throttle(self) -> float:
+        """
+        Reserves the next fetch slot of the budget.
+
+        Returns
+        -------
+        float
+            The seconds to wait before the fetch.
+        """
+        now = time.monotonic()
+        slot = max(self.__next_slot, now)
+        self.__next_slot = slot + 60.0 / self.requests_per_minute
+        return slot - now
+
+    def record(self, url: str, page_state: dict | None, changed: bool = False,
+               incomplete: bool | None = None, now: float | None = None) -> dict:
+        """
+        Records the outcome of a fetch and reschedules the page.
+
+        Parameters
+        ----------
+        url : str
+            The profile URL.
+        page_state : dict | None
+            The 'etag', 'last_modified' and 'content_hash' of the fetch, or None if it failed,
+            e.g. with an error status, which `Profile.fetch` raises for.
+        changed : bool
+            Whether the page content changed since the last fetch.
+        incomplete : bool | None
+            Whether the fetched profile has 'N/A' fields. Unchanged if None.
+        now : float | None
+            The epoch time of the fetch. Defaults to the current time.
+
+        Returns
+        -------
+        dict
+            The new state of the page, to be stored.
+        """
+        now = time.time() if now is None else now
+        state = dict(self.__states.get(url, {}))
+        interval = state.get('interval') or self.min_interval
+        if page_state is None:
+            state['failures'] = (state.get('failures') or 0) + 1
+        else:
+            state.update(page_state)
+            state['failures'] = 0
+            if changed:
+                state['last_change'] = now
+                interval = interval / 2
+            else:
+                interval = interval * 1.5
+        state['interval'] = min(max(interval, self.min_interval), self.max_interval)
+        state['last_fetch'] = now
+        if incomplete is not None:
+            if incomplete:
+                self.__incomplete.add(url)
+            else:
+                self.__incomplete.discard(url)
+        self.__states[url] = state
+        self.__schedule(url)
+        return state
@@ -1,14 +1,72 @@
 # External imports
+import os
+import ast
+import re
+import json
+import logging
 import sqlite3
 import asyncio
+import threading
 
 # Internal imports
 from .Profile import Profile
+from .ConnectionPool import ConnectionPool
+
+SCHEMA_VERSION = 4  # Stored in PRAGMA user_version. 1: links and publications are JSON arrays, 2: crawl scheduler state, 3: FTS5 index, 4: FTS5 index keyed by URL
+
+# Columns added to crawl_state by schema version 2, with their page state keys
+SCHEDULER_COLUMNS = {'last_fetch': 'REAL', 'last_change': 'REAL', 'failures': 'INTEGER DEFAULT 0', 'refresh_interval': 'REAL'}
+PAGE_STATE_COLUMNS = ('etag', 'last_modified', 'content_hash', 'last_fetch', 'last_change', 'failures', 'refresh_interval')
+PAGE_STATE_KEYS = ('etag', 'last_modified', 'content_hash', 'last_fetch', 'last_change', 'failures', 'interval')
+
+# The profile columns indexed by profiles_fts, after its unindexed url column, and their BM25 weights
+FTS_COLUMNS = {'name': 10.0, 'department': 2.0, 'summary': 1.0, 'publications': 1.0}
+
+
+def encode_list(values: list) -> str:
+    """Encodes a links or publications list for storage."""
+    return json.dumps(values, ensure_ascii=False, separators=(',', ':'))
+
+
+def decode_list(value: str) -> list:
+    """Decodes a stored links or publications list, accepting the legacy Python literal format."""
+    try:
+        return json.loads(value)
+    except ValueError:
+        return ast.literal_eval(value)  # Rows written before the migration to JSON
+
+
+def fts_query(text: str) -> str:
+    """Turns free text into an FTS5 query matching any of its words, so user input is never parsed as FTS5 syntax."""
+    words = dict.fromkeys(re.findall(r'\w+', text.lower()))  # Unique words, in order
+    return ' OR '.join(f'"{word}"' for word in words)
 
 class Database:
+    # Shared by every instance in the process, keyed by the absolute database path
+    _versions: dict[str, int] = {}  # Bumped by every write to the profiles table
+    _snapshots: dict[str, tuple[int, tuple[Profile, ...]]] = {}  # The last loaded profiles and their version
+    _lock = threading.Lock()  # Guards the two dictionaries above
+
     def __init__(self, db_name: str = 'profiles.db'):
         self.db_name = db_name  # Database filename
         self.loop = asyncio.get_event_loop()  # Get the current event loop to use asynchronously in the class
+        self.__key = os.path.abspath(db_name)  # Key of the shared version counter and snapshot
+        self.__pool = ConnectionPool.get(db_name)  # Persistent per-thread WAL connections
+
+    def _connect(self) -> sqlite3.Connection:
+        """Returns the pooled connection of the calling thread."""
+        return self.__pool.connection()
+
+    @property
+    def version(self) -> int:
+        """The version of the profiles table. It changes whenever a profile is inserted or updated."""
+        with Database._lock:
+            return Database._versions.get(self.__key, 0)
+
+    def _bump_version(self):
+        """Marks the cached profiles snapshot as stale."""
+        with Database._lock:
+            Database._versions[self.__key] = Database._versions.get(self.__key, 0) + 1
 
     async def create_table(self):
         """
@@ -18,7 +76,7 @@ class Database:
 
     def _sync_create_table(self):
         """Creates the profiles table if it doesn't exist."""
-        with sqlite3.connect(self.db_name) as conn:
+        with self._connect() as conn:
             cur = conn.cursor()
             cur.execute('''CREATE TABLE IF NOT EXISTS profiles (
                             name TEXT SECONDARY KEY,
@@ -30,6 +88,85 @@ class Database:
                             summary TEXT,
                             publications TEXT
                         )''')
+            # Stored BERT embeddings, keyed by profile URL and the hash of the profile text they were computed from
+            cur.execute('''CREATE TABLE IF NOT EXISTS embeddings (
+                            url TEXT PRIMARY KEY,
+                            hash TEXT,
+                            vector BLOB
+                        )''')
+            # Keywords generated from search queries, keyed by the normalised query and completion parameters
+            cur.execute('''CREATE TABLE IF NOT EXISTS keyword_cache (
+                            key TEXT PRIMARY KEY,
+                            created REAL,
+                            keywords TEXT
+                        )''')
+            # HTTP validators and content hash of the last fetch of every profile page, and its refresh schedule
+            cur.execute('''CREATE TABLE IF NOT EXISTS crawl_state (
+                            url TEXT PRIMARY KEY,
+                            etag TEXT,
+                            last_modified TEXT,
+                            content_hash TEXT,
+                            last_fetch REAL,
+                            last_change REAL,
+                            failures INTEGER DEFAULT 0,
+                            refresh_interval REAL
+                        )''')
+            conn.commit()
+            self._sync_migrate(conn)
+
+    def _sync_migrate(self, conn: sqlite3.Connection):
+        """Migrates the database in place to the current schema version."""
+        cur = conn.cursor()
+        version = cur.execute('PRAGMA user_version').fetchone()[0]
+        if version < 1:
+            # Re-encode links and publications from str(list) to JSON
+            logging.info("Migrating profiles to JSON encoded links and publications")
+            rows = cur.execute('SELECT url, links, publications FROM profiles').fetchall()
+            cur.executemany('UPDATE profiles SET links=?, publications=? WHERE url=?',
+                            [(encode_list(decode_list(links)), encode_list(decode_list(publications)), url)
+                             for url, links, publications in rows])
+            cur.execute('PRAGMA user_version = 1')
+            conn.commit()
+            logging.info(f"Migrated {len(rows)} profiles")
+        if version < 2:
+            # Add the crawl scheduler columns to a crawl_state table created before version 2
+            logging.info("Migrating crawl_state to hold the crawl schedule")
+            columns = {row[1] for row in cur.execute('PRAGMA table_info(crawl_state)')}
+            for column, column_type in SCHEDULER_COLUMNS.items():
+                if column not in columns:
+                    cur.execute(f'ALTER TABLE crawl_state ADD COLUMN {column} {column_type}')
+            cur.execute('PRAGMA user_version = 2')
+            conn.commit()
+        if version < 4:
+            # A full-text index over the profiles, kept in sync by triggers on the profiles table.
+            # It stores the profile URL itself: the external-content index of version 3 was keyed
+            # by the implicit rowid of profiles, which VACUUM may renumber
+            logging.info("Building the full-text index of the profiles")
+            columns = ', '.join(FTS_COLUMNS)
+            new_values = ', '.join(f'new.{column}' for column in FTS_COLUMNS)
+            for trigger in ('insert', 'delete', 'update'):
+                cur.execute(f'DROP TRIGGER IF EXISTS profiles_fts_{trigger}')
+            try:
+                cur.execute('DROP TABLE IF EXISTS profiles_fts')
+                cur.execute(f'''CREATE VIRTUAL TABLE profiles_fts USING fts5(
+                                url UNINDEXED, {columns},
+                                tokenize='porter unicode61 remove_diacritics 2'
+                            )''')
+            except sqlite3.OperationalError as exc:
+                logging.error(f"SQLite has no FTS5 support, full-text search is disabled: {exc}")
+                return
+            cur.execute(f'''CREATE TRIGGER profiles_fts_insert AFTER INSERT ON profiles BEGIN
+                                INSERT INTO profiles_fts (url, {columns}) VALUES (new.url, {new_values});
+                            END''')
+            cur.execute('''CREATE TRIGGER profiles_fts_delete AFTER DELETE ON profiles BEGIN
+                                DELETE FROM profiles_fts WHERE url = old.url;
+                            END''')
+            cur.execute(f'''CREATE TRIGGER profiles_fts_update AFTER UPDATE ON profiles BEGIN
+                                DELETE FROM profiles_fts WHERE url = old.url;
+                                INSERT INTO profiles_fts (url, {columns}) VALUES (new.url, {new_values});
+                            END''')
+            cur.execute(f'INSERT INTO profiles_fts (url, {columns}) SELECT url, {columns} FROM profiles')  # Index the existing profiles
+            cur.execute(f'PRAGMA user_version = {SCHEMA_VERSION}')
             conn.commit()
 
     async def update_profile(self, profile: Profile):
@@ -41,13 +178,15 @@ class Database:
     def _sync_update_profile(self, profile: Profile):
         """Updates a profile in the database."""
         profile_data = profile.to_dict()
-        with sqlite3.connect(self.db_name) as conn:
+        with self._connect() as conn:
             cur = conn.cursor()
             cur.execute('''UPDATE profiles SET name=?, department=?, contact=?, location=?, links=?, summary=?, publications=?
                             WHERE url=?''',
                         (profile_data['name'], profile_data['department'], profile_data['contact'], profile_data['location'],
-                         str(profile_data['links']), profile_data['summary'], str(profile_data['publications']), profile_data['url']))
+                         encode_list(profile_data['links']), profile_data['summary'], encode_list(profile_data['publications']), profile_data['url']))
             conn.commit()
+            if cur.rowcount > 0:
+                self._bump_version()
 
     async def insert_profile(self, profile: Profile):
         """
@@ -58,14 +197,41 @@ class Database:
     def _sync_insert_profile(self, profile: Profile):
         """Inserts a profile into the database."""
         profile_data = profile.to_dict()
-        with sqlite3.connect(self.db_name) as conn:
+        with self._connect() as conn:
             cur = conn.cursor()
             cur.execute('''INSERT OR IGNORE INTO profiles (name, url, department, contact, location, links, summary, publications)
                             VALUES (?, ?, ?, ?, ?, ?, ?, ?)''',
                         (profile_data['name'], profile_data['url'], profile_data['department'], profile_data['contact'],
-                         profile_data['location'], str(profile_data['links']), profile_data['summary'],
-                         str(profile_data['publications'])))
+                         profile_data['location'], encode_list(profile_data['links']), profile_data['summary'],
+                         encode_list(profile_data['publications'])))
             conn.commit()
+            if cur.rowcount > 0:
+                self._bump_version()
+
+    async def upsert_profiles(self, profiles: list[Profile]):
+        """
+        Asynchronously inserts or replaces a batch of profiles in one transaction.
+        """
+        await self.loop.run_in_executor(None, self._sync_upsert_profiles, profiles)
+
+    def _sync_upsert_profiles(self, profiles: list[Profile]):
+        """Inserts or replaces a batch of profiles in one transaction."""
+        rows = []
+        for profile in profiles:
+            profile_data = profile.to_dict()
+            rows.append((profile_data['name'], profile_data['url'], profile_data['department'], profile_data['contact'],
+                         profile_data['location'], encode_list(profile_data['links']), profile_data['summary'],
+                         encode_list(profile_data['publications'])))
+        with self._connect() as conn:
+            cur = conn.cursor()
+            cur.executemany('''INSERT INTO profiles (name, url, department, contact, location, links, summary, publications)
+                            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                            ON CONFLICT(url) DO UPDATE SET name=excluded.name, department=excluded.department,
+                                contact=excluded.contact, location=excluded.location, links=excluded.links,
+                                summary=excluded.summary, publications=excluded.publications''', rows)
+            conn.commit()
+        if rows:
+            self._bump_version()
 
     async def profile_exists(self, url: str) -> bool:
         """
@@ -75,20 +241,48 @@ class Database:
 
     def _sync_profile_exists(self, url: str) -> bool:
         """Checks if a profile exists in the database."""
-        with sqlite3.connect(self.db_name) as conn:
+        with self._connect() as conn:
             cur = conn.cursor()
             cur.execute('SELECT * FROM profiles WHERE url=?', (url,))
             return cur.fetchone() is not None
 
-    async def get_profiles(self) -> list[Profile]:
+    async def get_profiles(self) -> tuple[Profile, ...]:
         """
         Asynchronously retrieves all profiles from the database.
         """
-        return await self.loop.run_in_executor(None, self._sync_get_profiles)
+        return (await self.get_snapshot())[1]
+
+    async def get_snapshot(self) -> tuple[int, tuple[Profile, ...]]:
+        """
+        Asynchronously retrieves all profiles and the version they were read at.
+
+        The snapshot is cached in memory and shared by every instance, so SQLite is only
+        read again after a write bumped the version. The profiles are shared between
+        readers and must not be modified.
+        """
+        with Database._lock:
+            snapshot = Database._snapshots.get(self.__key)
+            if snapshot is not None and snapshot[0] == Database._versions.get(self.__key, 0):
+                return snapshot
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(None, self._sync_get_snapshot)
+
+    def _sync_get_snapshot(self) -> tuple[int, tuple[Profile, ...]]:
+        """Returns the cached (version, profiles) snapshot, reloading it if the version changed."""
+        with Database._lock:
+            version = Database._versions.get(self.__key, 0)
+            snapshot = Database._snapshots.get(self.__key)
+            if snapshot is not None and snapshot[0] == version:
+                return snapshot
+        # Read outside the lock. A write during the read bumps the version, so the next call reloads
+        snapshot = (version, tuple(self._sync_get_profiles()))
+        with Database._lock:
+            Database._snapshots[self.__key] = snapshot
+        return snapshot
 
     def _sync_get_profiles(self) -> list[Profile]:
         """Retrieves all profiles from the database."""
-        with sqlite3.connect(self.db_name) as conn:
+        with self._connect() as conn:
             cur = conn.cursor()
             # query = '''
             # SELECT * FROM profiles
@@ -104,9 +298,9 @@ class Database:
                     'department': row[2],
                     'contact': row[3],
                     'location': row[4],
-                    'links': eval(row[5]),
+                    'links': decode_list(row[5]),
                     'summary': row[6],
-                    'publications': eval(row[7])
+                    'publications': decode_list(row[7])
                 }
                 profile = Profile(url=row[1], **profile_data)
                 profiles.append(profile)
@@ -122,7 +316,7 @@ class Database:
     
     def _sync_fetch_existing_urls(self) -> list[str]:
         """Fetches existing URLs from the database."""
-        with sqlite3.connect(self.db_name) as conn:
+        with self._connect() as conn:
             cur = conn.cursor()
             query = '''
             SELECT url FROM profiles
@@ -134,7 +328,52 @@ class Database:
             '''
             cur.execute(query)
             return [row[0] for row in cur.fetchall()]  # Return a list of URLs. row[0] is the URL from cur.fetchall()
-    
+
+    async def fetch_incomplete_urls(self) -> list[str]:
+        """
+        Asynchronously fetches the URLs of the profiles with 'N/A' fields.
+        """
+        return await self.loop.run_in_executor(None, self._sync_fetch_incomplete_urls)
+
+    def _sync_fetch_incomplete_urls(self) -> list[str]:
+        """Fetches the URLs of the profiles with 'N/A' fields."""
+        with self._connect() as conn:
+            cur = conn.cursor()
+            cur.execute("SELECT url FROM profiles WHERE 'N/A' IN (name, department, contact, location, summary)")
+            return [row[0] for row in cur.fetchall()]
+
+    async def search_fts(self, query: str, limit: int | None = None) -> list[tuple[str, float]]:
+        """
+        Asynchronously searches the full-text index of the profiles.
+
+        Parameters
+        ----------
+        query : str
+            The free-text query. Profiles matching any of its words are returned.
+        limit : int | None
+            The maximum number of matches. All if None.
+
+        Returns
+        -------
+        list[tuple[str, float]]
+            The URL and BM25 score of the matching profiles, best first. Higher is better.
+        """
+        return await self.loop.run_in_executor(None, self._sync_search_fts, query, limit)
+
+    def _sync_search_fts(self, query: str, limit: int | None = None) -> list[tuple[str, float]]:
+        """Searches the full-text index of the profiles, best BM25 score first."""
+        match = fts_query(query)
+        if not match:
+            return []
+        weights = ', '.join(str(weight) for weight in (0.0, *FTS_COLUMNS.values()))  # The url column does not score
+        with self._connect() as conn:
+            cur = conn.cursor()
+            # bm25() is lower for better matches, so it is negated
+            cur.execute(f'''SELECT url, -bm25(profiles_fts, {weights}) AS score
+                            FROM profiles_fts WHERE profiles_fts MATCH ? ORDER BY score DESC LIMIT ?''',
+                        (match, -1 if limit is None else limit))
+            return cur.fetchall()
+
     async def fetch_profile(self, url: str) -> Profile:
         """
         Asynchronously fetches a profile from the database.
@@ -143,7 +382,7 @@ class Database:
     
     def _sync_fetch_profile(self, url: str) -> Profile:
         """Fetches a profile from the database."""
-        with sqlite3.connect(self.db_name) as conn:
+        with self._connect() as conn:
             cur = conn.cursor()
             cur.execute('SELECT * FROM profiles WHERE url=?', (url,))
             row = cur.fetchone()
@@ -153,14 +392,113 @@ class Database:
                     'department': row[2],
                     'contact': row[3],
                     'location': row[4],
-                    'links': eval(row[5]),
+                    'links': decode_list(row[5]),
                     'summary': row[6],
-                    'publications': eval(row[7])
+                    'publications': decode_list(row[7])
                 }
                 return Profile(url=row[1], **profile_data)
             return Profile(url=url)
 
+    async def get_embeddings(self) -> dict[str, tuple[str, bytes]]:
+        """
+        Asynchronously fetches the stored profile embeddings.
+        """
+        return await self.loop.run_in_executor(None, self._sync_get_embeddings)
+
+    def _sync_get_embeddings(self) -> dict[str, tuple[str, bytes]]:
+        """Fetches the stored profile embeddings as a {url: (hash, vector)} mapping."""
+        with self._connect() as conn:
+            cur = conn.cursor()
+            cur.execute('SELECT url, hash, vector FROM embeddings')
+            return {row[0]: (row[1], row[2]) for row in cur.fetchall()}
+
+    async def save_embeddings(self, rows: list[tuple[str, str, bytes]]):
+        """
+        Asynchronously inserts or replaces profile embeddings.
+        """
+        await self.loop.run_in_executor(None, self._sync_save_embeddings, rows)
+
+    def _sync_save_embeddings(self, rows: list[tuple[str, str, bytes]]):
+        """Inserts or replaces (url, hash, vector) embedding rows."""
+        with self._connect() as conn:
+            cur = conn.cursor()
+            cur.executemany('INSERT OR REPLACE INTO embeddings (url, hash, vector) VALUES (?, ?, ?)', rows)
+            conn.commit()
+
+    async def delete_embeddings(self, urls: list[str]):
+        """
+        Asynchronously deletes the embeddings of the given profile URLs.
+        """
+        await self.loop.run_in_executor(None, self._sync_delete_embeddings, urls)
+
+    def _sync_delete_embeddings(self, urls: list[str]):
+        """Deletes the embeddings of the given profile URLs."""
+        with self._connect() as conn:
+            cur = conn.cursor()
+            cur.executemany('DELETE FROM embeddings WHERE url=?', [(url,) for url in urls])
+            conn.commit()
+
+    async def get_cached_keywords(self, key: str) -> tuple[float, list[str]] | None:
+        """
+        Asynchronously fetches the cached keywords for a query key.
+        """
+        return await self.loop.run_in_executor(None, self._sync_get_cached_keywords, key)
+
+    def _sync_get_cached_keywords(self, key: str) -> tuple[float, list[str]] | None:
+        """Fetches the (created, keywords) entry for a query key, or None if there is none."""
+        with self._connect() as conn:
+            cur = conn.cursor()
+            cur.execute('SELECT created, keywords FROM keyword_cache WHERE key=?', (key,))
+            row = cur.fetchone()
+            return (row[0], json.loads(row[1])) if row else None
+
+    async def save_cached_keywords(self, key: str, created: float, keywords: list[str]):
+        """
+        Asynchronously stores the keywords generated for a query key.
+        """
+        await self.loop.run_in_executor(None, self._sync_save_cached_keywords, key, created, keywords)
+
+    def _sync_save_cached_keywords(self, key: str, created: float, keywords: list[str]):
+        """Stores the keywords generated for a query key."""
+        with self._connect() as conn:
+            cur = conn.cursor()
+            cur.execute('INSERT OR REPLACE INTO keyword_cache (key, created, keywords) VALUES (?, ?, ?)',
+                        (key, created, json.dumps(keywords)))
+            conn.commit()
+
+    async def get_page_states(self) -> dict[str, dict]:
+        """
+        Asynchronously fetches the state of the last fetch of every profile page.
+        """
+        return await self.loop.run_in_executor(None, self._sync_get_page_states)
+
+    def _sync_get_page_states(self) -> dict[str, dict]:
+        """Fetches {url: {'etag', 'last_modified', 'content_hash', 'last_fetch', 'last_change', 'failures', 'interval'}}."""
+        with self._connect() as conn:
+            cur = conn.cursor()
+            cur.execute(f'SELECT url, {", ".join(PAGE_STATE_COLUMNS)} FROM crawl_state')
+            return {row[0]: dict(zip(PAGE_STATE_KEYS, row[1:])) for row in cur.fetchall()}
+
+    async def save_page_states(self, page_states: dict[str, dict]):
+        """
+        Asynchronously stores the state of the last fetch of profile pages.
+        """
+        await self.loop.run_in_executor(None, self._sync_save_page_states, page_states)
+
+    def _sync_save_page_states(self, page_states: dict[str, dict]):
+        """Stores {url: {'etag', 'last_modified', 'content_hash', ...}} in one transaction. Missing keys are stored as NULL."""
+        with self._connect() as conn:
+            cur = conn.cursor()
+            cur.executemany(f'''INSERT OR REPLACE INTO crawl_state (url, {", ".join(PAGE_STATE_COLUMNS)})
+                            VALUES (?, {", ".join("?" * len(PAGE_STATE_COLUMNS))})''',
+                            [(url, *(state.get(key) for key in PAGE_STATE_KEYS)) for url, state in page_states.items()])
+            conn.commit()
+
 
 if __name__ == "__main__":
-    db = Database('profiles.db')
-    db.create_table()
\ No newline at end of file
+    async def main():
+        # Creates the tables and migrates profiles.db in place
+        db = Database('profiles.db')
+        await db.create_table()
+
+    asyncio.run(main())
\ No newline at end of file
@@ -0,0 +1,127 @@
+# Internal imports
+import asyncio
+import logging
+from typing import Callable, List
+
+# External imports
+import numpy as np
+
+# Local imports
+from .Corpus import Corpus
+from .Database import Database
+
+__all__ = ['EmbeddingIndex']
+
+
+class EmbeddingIndex:
+    """
+    A persistent matrix of profile embeddings.
+
+    Embeddings are stored in the database keyed by profile URL and the hash of the
+    profile text. Only profiles whose text changed since the last sync are re-embedded,
+    and the vectors are kept in memory as one contiguous, L2-normalised float32 matrix
+    whose rows follow the order of the last synced corpus.
+    """
+
+    def __init__(self, db: Database, encode: Callable[[List[str]], np.ndarray], batch_size: int = 32, tag: str = ''):
+        self.__db = db  # The database the embeddings are persisted in
+        self.__encode = encode  # Synchronous function mapping a list of texts to a (n, dim) array
+        self.__batch_size = batch_size  # The number of profiles embedded per forward pass
+        self.__tag = tag  # Prefixed to the stored hashes, so embeddings of another encoder are recomputed
+        self.__stored: dict[str, tuple[str, np.ndarray]] | None = None  # {url: (hash, vector)}, loaded lazily
+        self.__keys: list[tuple[str, str]] = []  # The (url, hash) pairs the matrix was built from
+        self.__lock = asyncio.Lock()  # Prevents concurrent searches from embedding the same profiles twice
+        self.matrix = np.zeros((0, 0), dtype=np.float32)  # One row per profile
+
+    @staticmethod
+    def __normalise(vectors: np.ndarray) -> np.ndarray:
+        """Returns the vectors scaled to unit length, so cosine similarity becomes a dot product."""
+        norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+        norms[norms == 0] = 1.0
+        return vectors / norms
+
+    async def __load(self):
+        """Loads the persisted embeddings from the database."""
+        rows = await self.__db.get_embeddings()
+        self.__stored = {url: (content_hash, np.frombuffer(vector, dtype=np.float32))
+                         for url, (content_hash, vector) in rows.items()}
+        logging.info(f"Loaded {len(self.__stored)} stored embeddings")
+
+    async def sync(self, corpus: Corpus) -> np.ndarray:
+        """
+        Brings the index up to date with the given corpus.
+
+        Parameters
+        ----------
+        corpus : Corpus
+            The profiles to index. The rows of the matrix follow the corpus order.
+
+        Returns
+        -------
+        np.ndarray
+            The embedding matrix of the corpus. It is never modified in place, so it stays
+            aligned with the corpus even if another sync replaces `matrix` later.
+        """
+        keys = [(url, self.__tag + content_hash) for url, content_hash in zip(corpus.urls, corpus.hashes)]
+        if keys == self.__keys:
+            return self.matrix  # Nothing changed since the last sync
+
+        async with self.__lock:
+            if keys == self.__keys:
+                return self.matrix
+            if self.__stored is None:
+                await self.__load()
+
+            # Embed only the profiles that are new or whose text changed
+            stale = [(index, url, content_hash) for index, (url, content_hash) in enumerate(keys)
+                     if self.__stored.get(url, (None,))[0] != content_hash]
+            if stale:
+                logging.info(f"Embedding {len(stale)} new or changed profiles")
+                loop = asyncio.get_running_loop()
+                rows = []
+                for start in range(0, len(stale), self.__batch_size):
+                    batch = stale[start:start + self.__batch_size]
+                    texts = [corpus.documents[index] for index, _, _ in batch]
+                    vectors = await loop.run_in_executor(None, self.__encode, texts)
+                    vectors = self.__normalise(np.asarray(vectors, dtype=np.float32))
+                    for (_, url, content_hash), vector in zip(batch, vectors):
+                        self.__stored[url] = (content_hash, vector)
+                        rows.append((url, content_hash, vector.tobytes()))
+                await self.__db.save_embeddings(rows)
+
+            # Forget embeddings of profiles that are no longer in the corpus
+            current = {url for url, _ in keys}
+            removed = [url for url in self.__stored if url not in current]
+            if removed:
+                for url in removed:
+                    del self.__stored[url]
+                await self.__db.delete_embeddings(removed)
+
+            if keys:
+                self.matrix = np.ascontiguousarray(np.stack([self.__stored[url][1] for url, _ in keys]))
+            else:
+                self.matrix = np.zeros((0, 0), dtype=np.float32)
+            self.__keys = keys
+            return self.matrix
+
+    @classmethod
+    def similarities(cls, matrix: np.ndarray, query_embedding: np.ndarray) -> np.ndarray:
+        """
+        Returns the cosine similarity between the query and every row of an embedding matrix.
+
+        Parameters
+        ----------
+        matrix : np.ndarray
+            A matrix returned by `sync`.
+        query_embedding : np.ndarray
+            The embedding of the query.
+
+        Returns
+        -------
+        np.ndarray
+            One similarity score per profile, in the order of the synced corpus.
+        """
+        if matrix.size == 0:
+            return np.zeros(len(matrix), dtype=np.float32)
+        query = cls.__normalise(np.asarray(query_embedding, dtype=np.float32).ravel())
+        return matrix @ query
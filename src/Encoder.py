@@ -0,0 +1,152 @@
+# Internal imports
+import os
+import logging
+import hashlib
+from typing import List
+
+# External imports
+import numpy as np
+import torch
+from transformers import AutoTokenizer, AutoModel
+
+__all__ = ['Encoder']
+
+try:
+    import onnxruntime
+    ONNX_AVAILABLE = True
+except ImportError:
+    ONNX_AVAILABLE = False
+
+
+class Encoder:
+    """
+    A sentence encoder: a transformer followed by attention-mask-aware mean pooling.
+
+    The transformer runs on one of these backends:
+
+    - 'torch': the fp32 PyTorch model, on the GPU if there is one.
+    - 'int8': the PyTorch model with its linear layers dynamically quantized to int8, on the CPU.
+    - 'onnx': the model exported to ONNX and run by ONNX Runtime on the CPU. Needs the
+      `onnxruntime` package. The export is saved next to `onnx_path`, under a name that
+      identifies the model and `max_length`, and reused by encoders of the same model.
+
+    The optimised backends approximate the fp32 embeddings; `agreement` measures by how much.
+    """
+    BACKENDS = ('torch', 'int8', 'onnx')
+
+    def __init__(self, model_name: str = 'sentence-transformers/all-MiniLM-L6-v2', backend: str = 'torch',
+                 max_length: int = 128, onnx_path: str = 'encoder.onnx'):
+        if backend not in Encoder.BACKENDS:
+            raise ValueError(f"Unknown encoder backend {backend!r}, expected one of {Encoder.BACKENDS}")
+        if backend == 'onnx' and not ONNX_AVAILABLE:
+            raise ImportError("The 'onnx' encoder backend needs the onnxruntime package")
+        self.model_name = model_name
+        self.backend = backend
+        self.max_length = max_length  # Longer texts are truncated
+        self.device = 'cuda' if backend == 'torch' and torch.cuda.is_available() else 'cpu'
+        self.tokenizer = AutoTokenizer.from_pretrained(model_name)
+        self.model = AutoModel.from_pretrained(model_name).eval()
+        self.__session = None  # The ONNX Runtime session of the 'onnx' backend
+        if backend == 'int8':
+            self.model = torch.ao.quantization.quantize_dynamic(self.model, {torch.nn.Linear}, dtype=torch.qint8)
+        elif backend == 'onnx':
+            self.__session = self.__load_onnx(self.export_path(onnx_path))
+            self.model = None  # Only needed for the export
+        else:
+            self.model.to(self.device)
+        logging.info(f"Encoder {model_name} loaded on the {backend} backend ({self.device})")
+
+    @property
+    def tag(self) -> str:
+        """Identifies the backend in stored embedding hashes, so switching backends re-embeds the profiles."""
+        return '' if self.backend == 'torch' else f'{self.backend}:'
+
+    def export_path(self, onnx_path: str) -> str:
+        """Returns the file of this model's ONNX export, e.g. encoder-1a2b3c4d5e6f.onnx for encoder.onnx."""
+        root, extension = os.path.splitext(onnx_path)
+        digest = hashlib.sha1(f"{self.model_name}\0{self.max_length}".encode('utf-8')).hexdigest()[:12]
+        return f"{root}-{digest}{extension or '.onnx'}"
+
+    def __load_onnx(self, path: str):
+        """Returns an ONNX Runtime session for the model, exporting it to `path` first if needed."""
+        if not os.path.exists(path):
+            logging.info(f"Exporting the encoder to {path}")
+            names = self.__input_names()
+            sample = self.tokenizer(['warm up', 'export sample'], padding=True, return_tensors='pt')
+            axes = {0: 'batch', 1: 'sequence'}
+            torch.onnx.export(_LastHiddenState(self.model, names), tuple(sample[name] for name in names), path,
+                              input_names=names, output_names=['last_hidden_state'],
+                              dynamic_axes={name: axes for name in [*names, 'last_hidden_state']},
+                              opset_version=17, dynamo=False)
+        return onnxruntime.InferenceSession(path, providers=['CPUExecutionProvider'])
+
+    def __input_names(self) -> List[str]:
+        """The tokenizer outputs the model takes."""
+        sample = self.tokenizer('warm up')
+        return [name for name in ('input_ids', 'attention_mask', 'token_type_ids') if name in sample]
+
+    def encode(self, texts: List[str]) -> np.ndarray:
+        """
+        Embeds a batch of texts.
+
+        Parameters
+        ----------
+        texts : List[str]
+            The texts to embed.
+
+        Returns
+        -------
+        np.ndarray
+            One float32 embedding per text, mean-pooled over the real tokens only.
+        """
+        if self.__session is not None:
+            encoded_input = self.tokenizer(texts, padding=True, truncation=True, max_length=self.max_length, return_tensors='np')
+            feeds = {node.name: encoded_input[node.name].astype(np.int64) for node in self.__session.get_inputs()}
+            hidden = self.__session.run(['last_hidden_state'], feeds)[0]
+            mask = encoded_input['attention_mask'][..., None].astype(np.float32)
+        else:
+            encoded_input = self.tokenizer(texts, padding=True, truncation=True, max_length=self.max_length,
+                                           return_tensors='pt').to(self.device)
+            with torch.no_grad():
+                hidden = self.model(**encoded_input).last_hidden_state.float().cpu().numpy()
+            mask = encoded_input['attention_mask'].cpu().numpy()[..., None].astype(np.float32)
+        # Average only over real tokens so padding does not dilute shorter texts
+        return ((hidden * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)).astype(np.float32)
+
+    def agreement(self, reference: 'Encoder', texts: List[str], batch_size: int = 32) -> np.ndarray:
+        """
+        Returns the cosine similarity between this encoder's and a reference encoder's embedding of each text.
+
+        Parameters
+        ----------
+        reference : Encoder
+            Usually the fp32 'torch' encoder of the same model.
+        texts : List[str]
+            The texts to compare on.
+        batch_size : int
+            Texts embedded per forward pass.
+
+        Returns
+        -------
+        np.ndarray
+            One cosine similarity per text. 1.0 means identical directions.
+        """
+        cosines = []
+        for start in range(0, len(texts), batch_size):
+            batch = texts[start:start + batch_size]
+            ours, theirs = self.encode(batch), reference.encode(batch)
+            norms = np.linalg.norm(ours, axis=1) * np.linalg.norm(theirs, axis=1)
+            cosines.append((ours * theirs).sum(axis=1) / np.clip(norms, 1e-12, None))
+        return np.concatenate(cosines) if cosines else np.zeros(0, dtype=np.float32)
+
+
+class _LastHiddenState(torch.nn.Module):
+    """Wraps the model for the ONNX export: positional token inputs in, last hidden state out."""
+
+    def __init__(self, model: torch.nn.Module, input_names: List[str]):
+        super().__init__()
+        self.model = model
+        self.input_names = input_names
+
+    def forward(self, *inputs: torch.Tensor) -> torch.Tensor:
+        return self.model(**dict(zip(self.input_names, inputs))).last_hidden_state
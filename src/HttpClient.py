@@ -0,0 +1,64 @@
+# Internal imports
+import asyncio
+import logging
+
+# External imports
+import httpx
+
+__all__ = ['HttpClient']
+
+try:
+    import h2  # noqa: F401 - httpx only needs it to be importable
+    HTTP2_AVAILABLE = True
+except ImportError:
+    HTTP2_AVAILABLE = False
+
+
+class HttpClient:
+    """
+    One long-lived `httpx.AsyncClient` shared by a whole crawl.
+
+    Connections are kept alive and reused, HTTP/2 is used when the `h2` package is
+    installed, and a semaphore bounds the number of requests in flight.
+
+    Use it as `async with HttpClient() as client:`.
+    """
+
+    def __init__(self, concurrency: int = 10, timeout: float = 20.0):
+        self.concurrency = concurrency  # Maximum requests in flight
+        self.__semaphore = asyncio.Semaphore(concurrency)
+        self.__client = httpx.AsyncClient(
+            http2=HTTP2_AVAILABLE,
+            limits=httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency, keepalive_expiry=60.0),
+            timeout=httpx.Timeout(timeout, connect=min(timeout, 10.0))
+        )
+        logging.info(f"HTTP client ready ({concurrency} concurrent requests, HTTP/2 {'on' if HTTP2_AVAILABLE else 'off'})")
+
+    async def __aenter__(self) -> 'HttpClient':
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+    async def get(self, url: str, **kwargs) -> httpx.Response:
+        """
+        Sends a GET request once a concurrency slot is free.
+
+        Parameters
+        ----------
+        url : str
+            The URL to fetch.
+        **kwargs
+            Passed on to `httpx.AsyncClient.get`.
+
+        Returns
+        -------
+        httpx.Response
+            The response.
+        """
+        async with self.__semaphore:
+            return await self.__client.get(url, **kwargs)
+
+    async def close(self):
+        """Closes the pooled connections."""
+        await self.__client.aclose()
@@ -0,0 +1,135 @@
+# Internal imports
+import json
+import time
+import asyncio
+import logging
+from collections import OrderedDict
+from typing import Awaitable, Callable
+
+# Local imports
+from .Database import Database
+
+__all__ = ['KeywordCache']
+
+
+class KeywordCache:
+    """
+    An LRU cache with a time-to-live for the keywords generated from a query.
+
+    Entries are keyed by the normalised query and the completion parameters. An optional
+    second tier persists entries in the database so they survive restarts. Concurrent
+    lookups of the same key share one in-flight fetch.
+    """
+
+    def __init__(self, max_size: int = 1024, ttl: float = 7 * 24 * 3600, db: Database | None = None):
+        self.__max_size = max_size  # The maximum number of entries kept in memory
+        self.__ttl = ttl  # Seconds an entry stays valid
+        self.__db = db  # The persistent tier, if any
+        self.__entries: OrderedDict[str, tuple[float, list[str]]] = OrderedDict()  # {key: (created, keywords)}
+        self.__inflight: dict[str, asyncio.Future] = {}  # Fetches currently running, by key
+        self.hits = 0  # Lookups answered from memory
+        self.persistent_hits = 0  # Lookups answered from the database
+        self.misses = 0  # Lookups that called the fetch function
+        self.coalesced = 0  # Lookups that joined a fetch already in flight
+
+    @staticmethod
+    def make_key(query: str, params: dict) -> str:
+        """
+        Returns the cache key for a query and the parameters used to expand it.
+
+        Parameters
+        ----------
+        query : str
+            The search query. Case and whitespace are normalised.
+        params : dict
+            The completion parameters. They must be JSON serialisable.
+
+        Returns
+        -------
+        str
+            The cache key.
+        """
+        normalised = " ".join(query.lower().split())
+        return json.dumps([normalised, params], sort_keys=True)
+
+    async def get(self, key: str, fetch: Callable[[], Awaitable[list[str]]]) -> list[str]:
+        """
+        Returns the cached keywords for the key, calling `fetch` on a miss.
+
+        Empty results are returned but not cached, so failed expansions are retried.
+
+        Parameters
+        ----------
+        key : str
+            A key made with `make_key`.
+        fetch : Callable[[], Awaitable[list[str]]]
+            Produces the keywords when they are not cached.
+
+        Returns
+        -------
+        list[str]
+            The keywords.
+        """
+        entry = self.__entries.get(key)
+        if entry is not None and time.time() - entry[0] < self.__ttl:
+            self.hits += 1
+            self.__entries.move_to_end(key)
+            return list(entry[1])
+
+        if key in self.__inflight:
+            self.coalesced += 1
+        else:
+            future = asyncio.ensure_future(self.__load(key, fetch))
+            self.__inflight[key] = future
+            future.add_done_callback(lambda _: self.__inflight.pop(key, None))
+        # Shield the shared fetch so a cancelled caller does not cancel it for the others
+        return list(await asyncio.shield(self.__inflight[key]))
+
+    async def __load(self, key: str, fetch: Callable[[], Awaitable[list[str]]]) -> list[str]:
+        """Loads the keywords from the persistent tier or from `fetch`, and caches them."""
+        if self.__db is not None:
+            try:
+                stored = await self.__db.get_cached_keywords(key)
+                if stored is not None and time.time() - stored[0] < self.__ttl:
+                    self.persistent_hits += 1
+                    self.__remember(key, stored[0], stored[1])
+                    return stored[1]
+            except Exception as e:
+                logging.error(f"Error while reading the keyword cache: {e}")
+
+        self.misses += 1
+        keywords = await fetch()
+        if keywords:
+            created = time.time()
+            self.__remember(key, created, keywords)
+            if self.__db is not None:
+                try:
+                    await self.__db.save_cached_keywords(key, created, keywords)
+                except Exception as e:
+                    logging.error(f"Error while writing the keyword cache: {e}")
+        return keywords
+
+    def __remember(self, key: str, created: float, keywords: list[str]):
+        """Stores an entry in memory, evicting the least recently used ones."""
+        self.__entries[key] = (created, keywords)
+        self.__entries.move_to_end(key)
+        while len(self.__entries) > self.__max_size:
+            self.__entries.popitem(last=False)
+
+    def stats(self) -> dict:
+        """
+        Returns the cache counters.
+
+        Returns
+        -------
+        dict
+            The number of entries, hits, persistent hits, misses and coalesced lookups.
+        """
+        return {
+            'size': len(self.__entries),
+            'hits': self.hits,
+            'persistent_hits': self.persistent_hits,
+            'misses': self.misses,
+            'coalesced': self.coalesced,
+            'in_flight': len(self.__inflight)
+        }
@@ -0,0 +1,80 @@
+# Internal imports
+from bisect import bisect_right
+from collections import Counter
+from typing import List
+
+# External imports
+import numpy as np
+
+# Local imports
+from .Corpus import Corpus
+
+__all__ = ['KeywordMatcher']
+
+SEPARATOR = '\0'  # Joins the documents. Never part of a keyword, so matches cannot span two documents
+
+
+class KeywordMatcher:
+    """
+    Counts, for every profile, how many keywords occur in its text.
+
+    The corpus is lower-cased once and joined into one string. Each distinct keyword is
+    then located with repeated `str.find` calls over that string, jumping to the next
+    document after every hit, so no document is touched once per keyword and documents
+    without a match are skipped entirely. The counts are the same as
+    `sum(keyword.lower() in str(profile).lower() for keyword in keywords)`.
+    """
+
+    def __init__(self, corpus: Corpus):
+        self.version = corpus.version  # The corpus version the matcher was built for
+        self.__documents = corpus.lowered
+        self.__text = SEPARATOR.join(self.__documents)
+        # Offset of the first character of every document, plus a sentinel past the end
+        self.__starts = []
+        offset = 0
+        for document in self.__documents:
+            self.__starts.append(offset)
+            offset += len(document) + len(SEPARATOR)
+        self.__starts.append(offset)
+
+    def count(self, keywords: List[str], memo: dict | None = None) -> np.ndarray:
+        """
+        Returns the number of keywords found in each profile.
+
+        Parameters
+        ----------
+        keywords : List[str]
+            The keywords to look for. Repeated keywords count once per occurrence in the list.
+        memo : dict | None
+            The documents found for each keyword by earlier calls, filled in by this one.
+            Sharing it across the queries of a batch searches for every distinct keyword once.
+
+        Returns
+        -------
+        np.ndarray
+            One count per profile, in corpus order.
+        """
+        counts = np.zeros(len(self.__documents), dtype=np.int64)
+        for keyword, weight in Counter(keyword.lower() for keyword in keywords).items():
+            if memo is None:
+                hits = self.__find(keyword)
+            elif keyword in memo:
+                hits = memo[keyword]
+            else:
+                hits = memo[keyword] = self.__find(keyword)
+            counts[hits] += weight
+        return counts
+
+    def __find(self, keyword: str) -> np.ndarray:
+        """Returns the index of every document containing the lower-cased keyword."""
+        if not keyword or SEPARATOR in keyword:
+            # Degenerate keywords are checked against each document directly
+            return np.flatnonzero(np.fromiter((keyword in document for document in self.__documents),
+                                              dtype=bool, count=len(self.__documents)))
+        hits = []
+        position = self.__text.find(keyword)
+        while position != -1:
+            document = bisect_right(self.__starts, position) - 1
+            hits.append(document)
+            position = self.__text.find(keyword, self.__starts[document + 1])
+        return np.array(hits, dtype=np.int64)
@@ -1,126 +1,277 @@
+import sys
+import asyncio
 import logging
+import hashlib
+from concurrent.futures import Executor
 import httpx
-from bs4 import BeautifulSoup
+from bs4 import BeautifulSoup, SoupStrainer
 
-__all__ = ['Profile']
+from .HttpClient import HttpClient
 
-class Profile:
-    def __init__(self, url: str, **profile_data) -> None:
-        self.url = url  # Profile URL
-        self.__data = {
-            'name': 'N/A',
-            'department': 'N/A',
-            'contact': 'N/A',
-            'location': 'N/A',
-            'links': [],
-            'summary': 'N/A',
-            'publications': [],
-            'url': url
-        } # Profile data
-        self.__soup = None  # Will be set asynchronously
-        if len(profile_data) == 0:
-            pass  # The actual scraping will happen asynchronously
-        else:
-            # Set the profile data if provided in the constructor
-            self.set_data(**profile_data)
-    
-    async def create(url: str) -> 'Profile':
-        """Asynchronously creates a Profile instance."""
-        profile = Profile(url)  # Create an instance
-        await profile.fetch_and_process_profile()
-        return profile
-    
-    async def fetch_and_process_profile(self):
-        """Fetches the profile page and processes the profile data."""
-        self.__soup = await self.__get_soup()  # Get the BeautifulSoup object
-        self.__data = await self.__get_main()  # Get the profile data
-    
-    async def __get_soup(self) -> BeautifulSoup:
-        """
-        Asynchronously returns the BeautifulSoup object for the profile URL.
-        """
-        async with httpx.AsyncClient() as client:
-            response = await client.get(self.url)
-        return BeautifulSoup(response.text, 'html.parser')
-    
-    async def __get_main(self) -> dict:
-        soup = self.__soup
-        # Set default values
-        profile_data = {
-            'name': 'N/A',
-            'department': 'N/A',
-            'contact': 'N/A',
-            'location': 'N/A',
-            'links': [],
-            'summary': 'N/A',
-            'publications': [],
-            'url': self.url
-        }
+__all__ = ['Profile', 'extract_profile']
 
-        # Name extraction with redundancy
-        try:
-            name_parts = [soup.find(id=part_id).text.strip() for part_id in ['bannername', 'titlepart1', 'titlepart2', 'titlepart3'] if soup.find(id=part_id)]
-            profile_data['name'] = ' '.join(name_parts) if name_parts else soup.find('h1').text.strip()
-        except Exception as e:
-            try:
-                profile_data['name'] = soup.find(class_='profile-name').text.strip()
-            except Exception as e:
-                logging.error(f"Error extracting name: {e}")
+try:
+    import lxml  # noqa: F401 - only needed as a BeautifulSoup backend
+    PARSER = 'lxml'
+except ImportError:
+    PARSER = 'html.parser'
 
-        # Department extraction with redundancy
-        try:
-            department_parts = [soup.find(id=part_id).text.strip() for part_id in ['titlepart4', 'titlepart5'] if soup.find(id=part_id)]
-            profile_data['department'] = ', '.join(department_parts) if department_parts else soup.find(class_='department-info').text.strip()
-        except Exception as e:
-            logging.error(f"Error extracting department: {e}")
+# The elements read by extract_profile. Everything else is dropped while parsing
+PROFILE_IDS = {'bannername', 'titlepart1', 'titlepart2', 'titlepart3', 'titlepart4', 'titlepart5',
+               'ot3', 'ot5', 'ot6', 'customContent', 'latestPubsContainer'}
+PROFILE_CLASSES = {'profile-name', 'department-info', 'contact-email', 'location-info', 'linklist',
+                   'affiliations', 'summary-text', 'publications-listing'}
+PROFILE_TAGS = {'h1'}
 
-        # Contact extraction with redundancy
+
+def _is_profile_tag(name: str, attrs: dict | None = None) -> bool:
+    """Whether a top-level tag is one extract_profile reads. Its whole subtree is then kept."""
+    if name in PROFILE_TAGS:
+        return True
+    if not attrs:
+        return False
+    if attrs.get('id') in PROFILE_IDS:
+        return True
+    classes = attrs.get('class') or []
+    if isinstance(classes, str):
+        classes = classes.split()
+    if not PROFILE_CLASSES.isdisjoint(classes):
+        return True
+    return name == 'a' and str(attrs.get('href') or '').startswith('mailto:')
+
+
+class ProfileStrainer(SoupStrainer):
+    """Parses only the elements extract_profile reads."""
+
+    def __init__(self):
+        super().__init__(name=_is_profile_tag)  # BeautifulSoup < 4.13 calls this with (name, attrs)
+
+    def allow_tag_creation(self, nsprefix, name, attrs) -> bool:  # BeautifulSoup >= 4.13
+        return _is_profile_tag(name, attrs)
+
+    def allow_string_creation(self, string) -> bool:  # BeautifulSoup >= 4.13
+        return False  # Text outside the kept elements is never read
+
+
+def extract_profile(html: str, url: str) -> dict:
+    """
+    Extracts the profile data from a profile page.
+
+    A module-level function returning a plain dict, so it can run in a process pool.
+
+    Parameters
+    ----------
+    html : str
+        The profile page.
+    url : str
+        The profile URL.
+
+    Returns
+    -------
+    dict
+        The profile data.
+    """
+    soup = BeautifulSoup(html, PARSER, parse_only=ProfileStrainer())
+    # Look every id up once. The first element with an id wins, like soup.find(id=...)
+    by_id = {}
+    for element in soup.find_all(id=True):
+        by_id.setdefault(element.get('id'), element)
+
+    # Set default values
+    profile_data = {
+        'name': 'N/A',
+        'department': 'N/A',
+        'contact': 'N/A',
+        'location': 'N/A',
+        'links': [],
+        'summary': 'N/A',
+        'publications': [],
+        'url': url
+    }
+
+    # Name extraction with redundancy
+    try:
+        name_parts = [by_id[part_id].text.strip() for part_id in ['bannername', 'titlepart1', 'titlepart2', 'titlepart3'] if part_id in by_id]
+        profile_data['name'] = ' '.join(name_parts) if name_parts else soup.find('h1').text.strip()
+    except Exception as e:
         try:
-            profile_data['contact'] = soup.select_one('a[href^="mailto:"]').get('href').replace('mailto:', '').strip()
+            profile_data['name'] = soup.find(class_='profile-name').text.strip()
         except Exception as e:
-            try:
-                profile_data['contact'] = soup.find(class_='contact-email').text.strip()
-            except Exception as e:
-                logging.error(f"Error extracting contact: {e}")
+            logging.error(f"Error extracting name: {e}")
+
+    # Department extraction with redundancy
+    try:
+        department_parts = [by_id[part_id].text.strip() for part_id in ['titlepart4', 'titlepart5'] if part_id in by_id]
+        profile_data['department'] = ', '.join(department_parts) if department_parts else soup.find(class_='department-info').text.strip()
+    except Exception as e:
+        logging.error(f"Error extracting department: {e}")
 
-        # Location extraction with redundancy
+    # Contact extraction with redundancy
+    try:
+        profile_data['contact'] = soup.select_one('a[href^="mailto:"]').get('href').replace('mailto:', '').strip()
+    except Exception as e:
         try:
-            location_parts = [soup.find(id=loc_id).text.strip() for loc_id in ['ot3', 'ot5', 'ot6'] if soup.find(id=loc_id)]
-            profile_data['location'] = ', '.join(location_parts) if location_parts else soup.find(class_='location-info').text.strip()
+            profile_data['contact'] = soup.find(class_='contact-email').text.strip()
         except Exception as e:
-            logging.error(f"Error extracting location: {e}")
+            logging.error(f"Error extracting contact: {e}")
 
-        # Links extraction with redundancy
+    # Location extraction with redundancy
+    try:
+        location_parts = [by_id[loc_id].text.strip() for loc_id in ['ot3', 'ot5', 'ot6'] if loc_id in by_id]
+        profile_data['location'] = ', '.join(location_parts) if location_parts else soup.find(class_='location-info').text.strip()
+    except Exception as e:
+        logging.error(f"Error extracting location: {e}")
+
+    # Links extraction with redundancy
+    try:
+        profile_data['links'] = [a.get("href") for a in soup.select('ul.linklist a')]
+    except Exception as e:
         try:
-            profile_data['links'] = [a.get("href") for a in soup.select('ul.linklist a')]
+            profile_data['links'] = [a.get("href") for a in soup.select('.affiliations a')]
         except Exception as e:
-            try:
-                profile_data['links'] = [a.get("href") for a in soup.select('.affiliations a')]
-            except Exception as e:
-                logging.error(f"Error extracting links: {e}")
+            logging.error(f"Error extracting links: {e}")
 
-        # Summary extraction with redundancy
+    # Summary extraction with redundancy
+    try:
+        summary = by_id.get('customContent')
+        summary_sections = summary.find_all('p') if summary is not None else []
+        profile_data['summary'] = " ".join([p.text.strip() for p in summary_sections])
+    except Exception as e:
         try:
-            summary_sections = soup.select('#customContent p')
-            profile_data['summary'] = " ".join([p.text.strip() for p in summary_sections])
+            profile_data['summary'] = soup.find(class_='summary-text').text.strip()
         except Exception as e:
-            try:
-                profile_data['summary'] = soup.find(class_='summary-text').text.strip()
-            except Exception as e:
-                logging.error(f"Error extracting summary: {e}")
+            logging.error(f"Error extracting summary: {e}")
 
-        # Publications extraction with redundancy
+    # Publications extraction with redundancy
+    try:
+        publications = by_id.get('latestPubsContainer')
+        publications_list = publications.select('.latestPubListing p') if publications is not None else []
+        profile_data['publications'] = [pub.text.strip() for pub in publications_list]
+    except Exception as e:
         try:
-            publications_list = soup.select('#latestPubsContainer .latestPubListing p')
-            profile_data['publications'] = [pub.text.strip() for pub in publications_list]
+            profile_data['publications'] = [pub.text.strip() for pub in soup.select('.publications-listing p')]
         except Exception as e:
-            try:
-                profile_data['publications'] = [pub.text.strip() for pub in soup.select('.publications-listing p')]
-            except Exception as e:
-                logging.error(f"Error extracting publications: {e}")
+            logging.error(f"Error extracting publications: {e}")
+
+    return profile_data
+
+
+class Profile:
+    """
+    A staff profile.
+
+    The fields are held in one tuple in `FIELDS` order, with the links and publications
+    as tuples, and instances have no `__dict__`, to keep large corpora small. The profile
+    text and its hash are rendered once and cached until the data changes. The dicts
+    returned by `get_data` and `to_dict` are copies: change the data with `set_data`.
+    """
+    __slots__ = ('url', '__values', '__text', '__hash')
+    FIELDS = ('name', 'department', 'contact', 'location', 'links', 'summary', 'publications', 'url')
+    LIST_FIELDS = ('links', 'publications')
+    SHARED_FIELDS = ('department', 'location')  # Few distinct values, so equal strings are shared across profiles
+    __INDEX = {key: index for index, key in enumerate(FIELDS)}  # {field: position in the values}
+
+    def __init__(self, url: str, **profile_data) -> None:
+        self.url = url  # Profile URL
+        self.__values: tuple = ('N/A', 'N/A', 'N/A', 'N/A', (), 'N/A', (), url)  # Profile data, in FIELDS order
+        self.__text: str | None = None  # The rendered profile text, once asked for
+        self.__hash: str | None = None  # The hash of the profile text, once asked for
+        if len(profile_data) == 0:
+            pass  # The actual scraping will happen asynchronously
+        else:
+            # Set the profile data if provided in the constructor
+            self.set_data(**profile_data)
+    
+    async def create(url: str, client: HttpClient | None = None, executor: Executor | None = None) -> 'Profile':
+        """
+        Asynchronously creates a Profile instance.
+
+        Parameters
+        ----------
+        url : str
+            The profile URL.
+        client : HttpClient | None
+            The shared HTTP client of the crawl. A one-off client is used if None.
+        executor : Executor | None
+            Where the page is parsed, e.g. a process pool. The default thread pool is used if None.
+        """
+        profile = Profile(url)  # Create an instance
+        await profile.fetch_and_process_profile(client, executor)
+        return profile
+
+    async def fetch(url: str, client: HttpClient | None = None, page_state: dict | None = None,
+                    executor: Executor | None = None) -> tuple['Profile | None', dict]:
+        """
+        Asynchronously fetches a profile page, skipping the parsing if it did not change.
 
-        return profile_data
+        The request is conditional on the ETag and Last-Modified validators of the previous
+        fetch, and a page served in full is still skipped if its content hash is unchanged.
+        Any other status than 2xx or 304 raises, so error pages are never hashed or parsed.
 
+        Parameters
+        ----------
+        url : str
+            The profile URL.
+        client : HttpClient | None
+            The shared HTTP client of the crawl. A one-off client is used if None.
+        page_state : dict | None
+            The 'etag', 'last_modified' and 'content_hash' of the previous fetch, if any.
+        executor : Executor | None
+            Where the page is parsed, e.g. a process pool. The default thread pool is used if None.
+
+        Returns
+        -------
+        tuple[Profile | None, dict]
+            The profile, or None if the page is unchanged, and the new page state.
+
+        Raises
+        ------
+        httpx.HTTPStatusError
+            If the page was not served, e.g. a 404, 429 or 5xx response.
+        """
+        headers = {}
+        if page_state:
+            if page_state.get('etag'):
+                headers['If-None-Match'] = page_state['etag']
+            if page_state.get('last_modified'):
+                headers['If-Modified-Since'] = page_state['last_modified']
+        response = await Profile.__get_page(url, client, headers)
+        if response.status_code == 304:
+            return None, page_state
+        response.raise_for_status()
+
+        new_state = {
+            'etag': response.headers.get('etag'),
+            'last_modified': response.headers.get('last-modified'),
+            'content_hash': hashlib.sha1(response.content).hexdigest()
+        }
+        if page_state and page_state.get('content_hash') == new_state['content_hash']:
+            return None, new_state
+
+        profile = Profile(url)
+        await profile.__process(response.text, executor)
+        return profile, new_state
+    
+    async def fetch_and_process_profile(self, client: HttpClient | None = None, executor: Executor | None = None):
+        """Fetches the profile page and processes the profile data."""
+        response = await Profile.__get_page(self.url, client)
+        response.raise_for_status()
+        await self.__process(response.text, executor)
+
+    async def __process(self, html: str, executor: Executor | None = None):
+        """Extracts the profile data from the page in the executor, off the event loop."""
+        loop = asyncio.get_running_loop()
+        self.set_data(**await loop.run_in_executor(executor, extract_profile, html, self.url))
+    
+    async def __get_page(url: str, client: HttpClient | None = None, headers: dict | None = None) -> httpx.Response:
+        """
+        Asynchronously requests a page, through the shared client if there is one.
+        """
+        if client is not None:
+            return await client.get(url, headers=headers)
+        async with httpx.AsyncClient() as one_off_client:
+            return await one_off_client.get(url, headers=headers)
+    
     def get_data(self, *args: str) -> dict:
         """
         Returns the profile data for the specified keys.
@@ -136,11 +287,16 @@ class Profile:
             The profile data for the specified keys.
         """
         if args:
-            data = {key: self.__data[key] for key in args}  # Get the data for the specified keys
+            data = {key: self.__get(key) for key in args}  # Get the data for the specified keys
             if len(data) == 1:
                 return data.popitem()[1]
             return data
-        return self.__data
+        return self.to_dict()
+
+    def __get(self, key: str):
+        """Returns one field, with the links and publications as lists."""
+        value = self.__values[Profile.__INDEX[key]]
+        return list(value) if key in Profile.LIST_FIELDS else value
 
     def set_data(self, **kwargs: dict) -> None:
         """
@@ -151,11 +307,18 @@ class Profile:
         **kwargs : dict
             The keys and values to be set.
         """
+        values = list(self.__values)
         for key, value in kwargs.items():
-            if key in self.__data:
-                self.__data[key] = value
-            else:
+            if key not in Profile.__INDEX:
                 logging.error(f"Key '{key}' does not exist in profile data")
+                continue
+            if key in Profile.LIST_FIELDS:
+                value = tuple(value)
+            elif key in Profile.SHARED_FIELDS and isinstance(value, str):
+                value = sys.intern(value)
+            values[Profile.__INDEX[key]] = value
+        self.__values = tuple(values)
+        self.__text = self.__hash = None
 
     def to_dict(self) -> dict:
         """
@@ -166,7 +329,20 @@ class Profile:
         dict
             The profile data as a dictionary.
         """
-        return self.__data    
+        return {key: self.__get(key) for key in Profile.FIELDS}
+
+    def content_hash(self) -> str:
+        """
+        Returns a hash of the profile text, used to detect changed profiles.
+
+        Returns
+        -------
+        str
+            The SHA-1 hex digest of the profile string.
+        """
+        if self.__hash is None:
+            self.__hash = hashlib.sha1(str(self).encode('utf-8')).hexdigest()
+        return self.__hash
 
     def __str__(self) -> str:
         """
@@ -180,20 +356,19 @@ class Profile:
         - Links
         - Summary
         - Publications
+
+        The string is built once and cached until the data changes.
         
         Returns
         -------
         str
             The profile data as a string.
         """
-        profile_str: str = f"Name: {self.__data['name']}, "
-        profile_str += f"Department: {self.__data['department']}, "
-        profile_str += f"Contact: {self.__data['contact']}, "
-        profile_str += f"Location: {self.__data['location']}, "
-        profile_str += f"Links: {', '.join(self.__data['links'])}, "
-        profile_str += f"Summary: {self.__data['summary']}, "
-        profile_str += f"Publications: {', '.join(self.__data['publications'])}"
-        return profile_str
+        if self.__text is None:
+            name, department, contact, location, links, summary, publications, _ = self.__values
+            self.__text = (f"Name: {name}, Department: {department}, Contact: {contact}, Location: {location}, "
+                           f"Links: {', '.join(links)}, Summary: {summary}, Publications: {', '.join(publications)}")
+        return self.__text
 
     def __repr__(self) -> str:
         return self.__str__()
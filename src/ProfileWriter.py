@@ -0,0 +1,138 @@
+# Internal imports
+import asyncio
+import logging
+from typing import Callable, List
+
+# Local imports
+from .Profile import Profile
+from .Database import Database
+
+__all__ = ['ProfileWriter']
+
+
+class ProfileWriter:
+    """
+    A write-behind batcher for scraped profiles.
+
+    Profiles are kept only if they are new or longer than the stored or already queued
+    version, compared against one map of stored profile lengths prefetched when the writer
+    starts. Kept profiles are flushed with one multi-row upsert per batch, when the batch
+    is full or when the flush interval has passed. A batch that fails to write goes back
+    into the buffer with its page states and is retried with the next flush.
+
+    Use it as `async with ProfileWriter(db) as writer:`, which flushes the rest on exit.
+    """
+
+    def __init__(self, db: Database, batch_size: int = 50, flush_interval: float = 5.0,
+                 on_failure: Callable[[List[str]], None] | None = None):
+        self.__db = db  # The database the profiles are written to
+        self.__batch_size = batch_size  # Profiles per transaction
+        self.__flush_interval = flush_interval  # Maximum seconds a profile waits in the buffer
+        self.__lengths: dict[str, int] = {}  # {url: len(str(profile))} of the stored profiles
+        self.__buffer: dict[str, Profile] = {}  # Profiles waiting to be written, by URL
+        self.__page_states: dict[str, dict] = {}  # Page states waiting to be written, by URL
+        self.__on_failure = on_failure  # Called with the URLs of a batch whose write failed
+        self.__lock = asyncio.Lock()  # Serialises flushes
+        self.__task: asyncio.Task | None = None  # The periodic flush task
+        self.written = 0  # Profiles written
+        self.skipped = 0  # Profiles not longer than the stored version
+
+    async def __aenter__(self) -> 'ProfileWriter':
+        await self.start()
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+    async def start(self):
+        """Prefetches the stored profile lengths and starts the periodic flush."""
+        profiles = await self.__db.get_profiles()
+        self.__lengths = {profile.get_data('url'): len(str(profile)) for profile in profiles}
+        self.__task = asyncio.create_task(self.__run())
+
+    async def __run(self):
+        """Flushes the buffer every flush interval."""
+        while True:
+            await asyncio.sleep(self.__flush_interval)
+            await self.flush()
+
+    async def submit(self, profile: Profile) -> bool:
+        """
+        Queues a profile for writing if it is new or longer than the stored one.
+
+        Parameters
+        ----------
+        profile : Profile
+            The scraped profile.
+
+        Returns
+        -------
+        bool
+            Whether the profile was queued.
+        """
+        url = profile.get_data('url')
+        length = len(str(profile))
+        queued = self.__buffer.get(url)
+        if length <= max(self.__lengths.get(url, -1), len(str(queued)) if queued is not None else -1):
+            self.skipped += 1
+            return False
+        self.__buffer[url] = profile
+        if len(self.__buffer) >= self.__batch_size:
+            await self.flush()
+        return True
+
+    def submit_page_state(self, url: str, page_state: dict):
+        """
+        Queues the state of a page fetch, written with the next batch.
+
+        Parameters
+        ----------
+        url : str
+            The profile URL.
+        page_state : dict
+            The 'etag', 'last_modified' and 'content_hash' of the fetch.
+        """
+        self.__page_states[url] = page_state
+
+    async def flush(self):
+        """Writes the buffered profiles, then the buffered page states."""
+        async with self.__lock:
+            if not self.__buffer and not self.__page_states:
+                return
+            batch = list(self.__buffer.values())
+            page_states = self.__page_states
+            self.__buffer, self.__page_states = {}, {}
+            if batch:
+                try:
+                    await self.__db.upsert_profiles(batch)
+                except Exception as exc:
+                    logging.error(f"Writing a batch of {len(batch)} profiles failed, retrying with the next flush: {exc}")
+                    self.__requeue(batch, page_states)
+                    if self.__on_failure is not None:
+                        self.__on_failure([profile.get_data('url') for profile in batch])
+                    return
+                # Only stored profiles raise the bar for later submissions
+                self.__lengths.update((profile.get_data('url'), len(str(profile))) for profile in batch)
+                self.written += len(batch)
+                logging.info(f"Wrote a batch of {len(batch)} profiles")
+            # Only after the profiles, so a failed write is not mistaken for an unchanged page next time
+            if page_states:
+                try:
+                    await self.__db.save_page_states(page_states)
+                except Exception as exc:
+                    logging.error(f"Writing {len(page_states)} page states failed, retrying with the next flush: {exc}")
+                    self.__requeue([], page_states)
+
+    def __requeue(self, batch: List[Profile], page_states: dict[str, dict]):
+        """Puts a failed batch back in the buffer. Entries submitted since the flush started are newer and kept."""
+        for profile in batch:
+            self.__buffer.setdefault(profile.get_data('url'), profile)
+        for url, page_state in page_states.items():
+            self.__page_states.setdefault(url, page_state)
+
+    async def close(self):
+        """Stops the periodic flush and writes the remaining profiles."""
+        if self.__task is not None:
+            self.__task.cancel()
+            self.__task = None
+        await self.flush()
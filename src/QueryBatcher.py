@@ -0,0 +1,102 @@
+# Internal imports
+import asyncio
+import logging
+from typing import Callable, List
+
+# External imports
+import numpy as np
+
+__all__ = ['QueryBatcher']
+
+
+class QueryBatcher:
+    """
+    Gathers concurrent query texts into one padded forward pass of the encoder.
+
+    A batch holds at most `max_batch_size` texts. Texts arriving while a batch is being
+    encoded queue up for the next one. When the last batch held several texts, i.e. under
+    concurrent load, the first text of a batch also waits up to `max_wait` seconds for
+    others to join; a lone client never waits. Identical texts in a batch are encoded
+    once. Each caller gets the embedding of its own text.
+    """
+
+    def __init__(self, encode: Callable[[List[str]], np.ndarray], max_batch_size: int = 32, max_wait: float = 0.002):
+        self.__encode = encode  # Synchronous function mapping a list of texts to a (n, dim) array
+        self.max_batch_size = max_batch_size  # Texts per forward pass
+        self.max_wait = max_wait  # Seconds the first text of a batch waits for others
+        self.__queue: asyncio.Queue | None = None  # (text, future) pairs waiting for a batch
+        self.__worker: asyncio.Task | None = None  # Encodes the batches, started on first use
+        self.__loop: asyncio.AbstractEventLoop | None = None  # The loop the queue and worker belong to
+        self.__concurrent = False  # Whether the last batch held more than one text
+        self.batches = 0  # Forward passes run
+        self.texts = 0  # Texts embedded
+
+    def stats(self) -> dict:
+        """Returns the number of forward passes, texts embedded and the mean batch size."""
+        return {'batches': self.batches, 'texts': self.texts,
+                'mean_batch_size': self.texts / self.batches if self.batches else 0.0}
+
+    async def embed(self, text: str) -> np.ndarray:
+        """
+        Embeds one text as part of the next batch.
+
+        Parameters
+        ----------
+        text : str
+            The text to embed.
+
+        Returns
+        -------
+        np.ndarray
+            The embedding of the text.
+        """
+        loop = asyncio.get_running_loop()
+        if self.__loop is not loop or self.__worker is None or self.__worker.done():
+            self.__loop = loop
+            self.__queue = asyncio.Queue()
+            self.__worker = loop.create_task(self.__run())
+        future = loop.create_future()
+        self.__queue.put_nowait((text, future))
+        return await future
+
+    async def __next_batch(self) -> list[tuple[str, asyncio.Future]]:
+        """Waits for a text, then collects more until the batch is full or the wait is over."""
+        loop = asyncio.get_running_loop()
+        batch = [await self.__queue.get()]
+        deadline = loop.time() + (self.max_wait if self.__concurrent else 0.0)
+        while len(batch) < self.max_batch_size:
+            if not self.__queue.empty():
+                batch.append(self.__queue.get_nowait())
+                continue
+            timeout = deadline - loop.time()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self.__queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def __run(self):
+        """Encodes the batches one at a time, for as long as the loop runs."""
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [(text, future) for text, future in await self.__next_batch() if not future.done()]
+            if not batch:
+                continue  # Every caller of the batch was cancelled
+            texts = list(dict.fromkeys(text for text, _ in batch))  # Unique texts, in order
+            try:
+                vectors = await loop.run_in_executor(None, self.__encode, texts)
+            except Exception as exc:
+                logging.error(f"Encoding a batch of {len(texts)} queries failed: {exc}")
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(exc)
+                continue
+            self.batches += 1
+            self.texts += len(batch)
+            self.__concurrent = len(batch) > 1
+            rows = {text: row for row, text in enumerate(texts)}
+            for text, future in batch:
+                if not future.done():
+                    future.set_result(vectors[rows[text]])
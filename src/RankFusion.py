@@ -0,0 +1,78 @@
+# External imports
+import numpy as np
+
+__all__ = ['RankFusion', 'top_k']
+
+
+def top_k(scores: np.ndarray, k: int) -> np.ndarray:
+    """
+    Returns the indices of the k highest scores, best first.
+
+    Uses a partial selection instead of a full sort. Equal scores keep their index
+    order, so the result is the same as a stable descending sort cut at k.
+
+    Parameters
+    ----------
+    scores : np.ndarray
+        The scores to select from.
+    k : int
+        The number of indices to return.
+
+    Returns
+    -------
+    np.ndarray
+        The selected indices.
+    """
+    n = len(scores)
+    if k <= 0 or n == 0:
+        return np.zeros(0, dtype=np.int64)
+    if k >= n:
+        return np.argsort(-scores, kind='stable')
+    # The k-th highest score. Everything above it is selected, ties are taken in index order
+    threshold = scores[np.argpartition(-scores, k - 1)[:k]].min()
+    above = np.flatnonzero(scores > threshold)
+    ties = np.flatnonzero(scores == threshold)[:k - len(above)]
+    selected = np.concatenate([above, ties])
+    return selected[np.argsort(-scores[selected], kind='stable')]
+
+
+class RankFusion:
+    """
+    Fuses the per-profile scores of several rankers into one score.
+
+    Each ranker's scores are min-max normalised to [0, 1] over the corpus and combined
+    as a weighted sum, so fusing is linear in the corpus size. Rankers that did not run
+    are left out.
+    """
+
+    def __init__(self, weights: dict[str, float]):
+        self.weights = weights  # The weight of each ranker, by name
+
+    @staticmethod
+    def normalise(scores: np.ndarray) -> np.ndarray:
+        """Returns the scores rescaled to [0, 1]. Constant scores become zeros."""
+        scores = np.nan_to_num(np.asarray(scores, dtype=np.float64))
+        low, high = scores.min(initial=0.0), scores.max(initial=0.0)
+        if high - low <= 0:
+            return np.zeros_like(scores)
+        return (scores - low) / (high - low)
+
+    def fuse(self, scores: dict[str, np.ndarray]) -> np.ndarray:
+        """
+        Returns the fused score of every profile.
+
+        Parameters
+        ----------
+        scores : dict[str, np.ndarray]
+            The corpus-aligned scores of each ranker that ran, by ranker name.
+
+        Returns
+        -------
+        np.ndarray
+            The weighted sum of the normalised scores.
+        """
+        fused = None
+        for name, ranker_scores in scores.items():
+            weighted = self.weights.get(name, 1.0) * self.normalise(ranker_scores)
+            fused = weighted if fused is None else fused + weighted
+        return fused if fused is not None else np.zeros(0)
@@ -0,0 +1,61 @@
+# External imports
+import numpy as np
+
+# Local imports
+from .Corpus import Corpus
+from .RankFusion import top_k
+from .SearchResult import SearchResult
+
+__all__ = ['Ranking']
+
+
+class Ranking:
+    """
+    The fused and per-stage scores of one search over every profile of a corpus snapshot.
+
+    Pages of results are cut from it by partial selection, so deeper pages of the same
+    search reuse the scores instead of running the ranking stages again.
+    """
+
+    def __init__(self, corpus: Corpus, results: dict[str, np.ndarray], missed: list[str], fused: np.ndarray,
+                 stale: list[str] | None = None):
+        self.corpus = corpus  # The snapshot the stages scored
+        self.results = results  # The corpus-aligned scores of each finished stage, by stage name
+        self.missed = missed  # The stages that failed or missed the deadline
+        self.fused = fused  # The fused score of every profile, in corpus order
+        self.stale = stale or []  # The stages that scored on an index built for an older corpus
+
+    def __len__(self) -> int:
+        return len(self.fused)
+
+    @property
+    def nbytes(self) -> int:
+        """The approximate memory size of the scores in bytes."""
+        return 256 + self.fused.nbytes + sum(np.asarray(scores).nbytes for scores in self.results.values())
+
+    def page(self, offset: int = 0, top_n: int = 10) -> SearchResult:
+        """
+        Returns one page of the ranked profiles.
+
+        Parameters
+        ----------
+        offset : int
+            The number of better ranked profiles to skip.
+        top_n : int
+            The number of profiles on the page.
+
+        Returns
+        -------
+        SearchResult
+            The profiles ranked `offset` to `offset + top_n`, with their fused and per-stage scores.
+        """
+        indices = top_k(self.fused, offset + top_n)[offset:]
+        return SearchResult(
+            profiles=[self.corpus.profiles[index] for index in indices],
+            stages=list(self.results),
+            missed=self.missed,
+            scores=[float(self.fused[index]) for index in indices],
+            stage_scores=[{name: float(scores[index]) for name, scores in self.results.items()} for index in indices],
+            offset=offset,
+            total=len(self)
+        )
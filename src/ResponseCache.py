@@ -0,0 +1,179 @@
+# Internal imports
+import json
+import asyncio
+from collections import OrderedDict
+from typing import Awaitable, Callable
+
+# Local imports
+from .Ranking import Ranking
+
+__all__ = ['ResponseCache']
+
+
+class ResponseCache:
+    """
+    An LRU cache of search rankings, bounded by their memory size.
+
+    Entries are keyed by the normalised query, the search mode and the corpus version,
+    and hold the scores of every profile, so every page of a search is cut from one
+    entry. When a lookup sees a new corpus version, the entries of the previous versions
+    are dropped, so rankings never outlive the profiles they were scored on. Rankings
+    with missed stages, or stages scored on an index still being rebuilt, are returned
+    but not cached, so a later request can get the complete ranking. Concurrent lookups of the same key share one in-flight search.
+    """
+
+    def __init__(self, max_bytes: int = 32 * 1024 * 1024):
+        self.max_bytes = max_bytes  # The maximum size of the cached rankings
+        self.__entries: OrderedDict[str, tuple[int, Ranking]] = OrderedDict()  # {key: (size, ranking)}
+        self.__inflight: dict[str, asyncio.Future] = {}  # Searches currently running, by key
+        self.__version: str | None = None  # The corpus version of the cached rankings
+        self.bytes = 0  # The size of the cached rankings
+        self.hits = 0  # Lookups answered from the cache
+        self.misses = 0  # Lookups that ran the search
+        self.coalesced = 0  # Lookups that joined a search already in flight
+        self.evictions = 0  # Entries dropped to stay under the size bound
+        self.invalidations = 0  # Entries dropped because the corpus changed
+
+    @staticmethod
+    def make_key(query: str, mode: str, version: str, weights: dict | None = None) -> str:
+        """
+        Returns the cache key of a search.
+
+        Parameters
+        ----------
+        query : str
+            The search query. Case and whitespace are normalised.
+        mode : str
+            The search mode.
+        version : str
+            The version of the corpus the search runs on.
+        weights : dict | None
+            The fusion weights of the mode, so changing them does not serve stale rankings.
+
+        Returns
+        -------
+        str
+            The cache key.
+        """
+        normalised = " ".join(query.lower().split())
+        return json.dumps([normalised, mode, version, weights], sort_keys=True)
+
+    async def get(self, key: str, version: str, search: Callable[[], Awaitable[Ranking]]) -> Ranking:
+        """
+        Returns the cached ranking for the key, calling `search` on a miss.
+
+        Parameters
+        ----------
+        key : str
+            A key made with `make_key`.
+        version : str
+            The corpus version in the key. Entries of other versions are dropped.
+        search : Callable[[], Awaitable[Ranking]]
+            Runs the search when it is not cached.
+
+        Returns
+        -------
+        Ranking
+            The ranking. It is shared between callers and must not be modified.
+        """
+        cached = self.lookup(key, version)
+        if cached is not None:
+            return cached
+
+        if key in self.__inflight:
+            self.coalesced += 1
+        else:
+            future = asyncio.ensure_future(self.__load(key, version, search))
+            self.__inflight[key] = future
+            future.add_done_callback(lambda _: self.__inflight.pop(key, None))
+        # Shield the shared search so a cancelled caller does not cancel it for the others
+        return await asyncio.shield(self.__inflight[key])
+
+    def lookup(self, key: str, version: str) -> Ranking | None:
+        """
+        Returns the cached ranking for the key, or None without running the search.
+
+        A lookup that is neither cached nor in flight counts as a miss.
+
+        Parameters
+        ----------
+        key : str
+            A key made with `make_key`.
+        version : str
+            The corpus version in the key. Entries of other versions are dropped.
+
+        Returns
+        -------
+        Ranking | None
+            The cached ranking, if any.
+        """
+        if version != self.__version:
+            self.invalidations += len(self.__entries)
+            self.clear()
+            self.__version = version
+
+        entry = self.__entries.get(key)
+        if entry is not None:
+            self.hits += 1
+            self.__entries.move_to_end(key)
+            return entry[1]
+        if key not in self.__inflight:
+            self.misses += 1
+        return None
+
+    def store(self, key: str, version: str, ranking: Ranking):
+        """
+        Caches a ranking computed outside `get`, if it is complete and its corpus version is current.
+
+        A ranking with stages scored on an index that lags behind the corpus is not complete:
+        it would otherwise be served until the corpus changes again, long after the rebuild.
+        """
+        if not ranking.missed and not ranking.stale and len(ranking) and version == self.__version:
+            self.__remember(key, ranking)
+
+    async def __load(self, key: str, version: str, search: Callable[[], Awaitable[Ranking]]) -> Ranking:
+        """Runs the search and caches a complete ranking."""
+        ranking = await search()
+        self.store(key, version, ranking)
+        return ranking
+
+    def __remember(self, key: str, ranking: Ranking):
+        """Stores an entry, evicting the least recently used ones to stay under the size bound."""
+        size = ranking.nbytes
+        if size > self.max_bytes:
+            return
+        if key in self.__entries:
+            self.bytes -= self.__entries.pop(key)[0]
+        self.__entries[key] = (size, ranking)
+        self.bytes += size
+        while self.bytes > self.max_bytes:
+            self.bytes -= self.__entries.popitem(last=False)[1][0]
+            self.evictions += 1
+
+    def clear(self):
+        """Drops every cached ranking."""
+        self.__entries.clear()
+        self.bytes = 0
+
+    def stats(self) -> dict:
+        """
+        Returns the cache state and counters.
+
+        Returns
+        -------
+        dict
+            The number of entries, their size and bound, the corpus version, and
+            the hits, misses, coalesced lookups, evictions and invalidations.
+        """
+        return {
+            'size': len(self.__entries),
+            'bytes': self.bytes,
+            'max_bytes': self.max_bytes,
+            'version': self.__version,
+            'hits': self.hits,
+            'misses': self.misses,
+            'coalesced': self.coalesced,
+            'evictions': self.evictions,
+            'invalidations': self.invalidations,
+            'in_flight': len(self.__inflight)
+        }
@@ -1,39 +1,108 @@
 # Internal imports
 import os
+import json
+import base64
+import hashlib
 import logging
 
 # External imports
-from fastapi import APIRouter
-from pydantic import BaseModel
+from fastapi import APIRouter, Depends, HTTPException, Request, Response
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel, Field
 
 # Local imports
 import dotenv
 from .SearchEngine import SearchEngine
-from .Database import Database
+from .SearchResult import SearchResult
 
 dotenv.load_dotenv(override=True)
 
+MAX_TOP_N = int(os.getenv("MAX_TOP_N", "100"))  # The largest page a request can ask for
+
 # Model for the profile request
 class ProfileRequest(BaseModel):
     query: str # The query to search for
+    top_n: int | None = Field(None, ge=1, le=MAX_TOP_N) # The number of profiles per page, defaults to the mode's
+    offset: int = Field(0, ge=0) # The number of better ranked profiles to skip
+    cursor: str | None = None # The next_cursor of the previous page. Overrides top_n and offset
+
+
+# Model for the batch profile request
+class BatchRequest(BaseModel):
+    queries: list[str] # The queries to search for
+    mode: str = "norm" # The search mode: fts, quick, norm or long
+    top_n: int | None = Field(None, ge=1, le=MAX_TOP_N) # The number of profiles per query, defaults to the mode's
+
+
+__all__ = ["Router", "get_engine"]
 
+Router = APIRouter()  # The router for the API. Accessed in src/App.py
 
-__all__ = ["Router"]
+# The number of profiles returned by each search mode
+TOP_N = {"fts": 30, "quick": 30, "norm": 20, "long": 10}
+MAX_BATCH_QUERIES = int(os.getenv("MAX_BATCH_QUERIES", "1000"))  # The largest batch accepted by /profiles/batch
 
-Router = APIRouter()  # The router for the API. Accessed in backend.py
 
-OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
+def query_hash(query: str, mode: str) -> str:
+    """Identifies a search in its cursors, so a cursor cannot page through another search."""
+    return hashlib.sha1(f"{mode}\0{' '.join(query.lower().split())}".encode("utf-8")).hexdigest()[:16]
+
+
+def get_page(req: ProfileRequest, mode: str) -> tuple[int, int]:
+    """
+    Returns the offset and size of the requested page, from its cursor if it has one.
+
+    Raises
+    ------
+    HTTPException
+        If the cursor is malformed or belongs to another search.
+    """
+    if req.cursor is None:
+        return req.offset, req.top_n or TOP_N[mode]
+    try:
+        cursor = json.loads(base64.urlsafe_b64decode(req.cursor.encode("ascii")))
+        offset, top_n, search = int(cursor["offset"]), int(cursor["top_n"]), cursor["search"]
+    except Exception:
+        raise HTTPException(status_code=400, detail="Malformed cursor")
+    if search != query_hash(req.query, mode) or offset < 0 or not 1 <= top_n <= MAX_TOP_N:
+        raise HTTPException(status_code=400, detail="The cursor does not belong to this search")
+    return offset, top_n
+
+
+def next_cursor(req: ProfileRequest, mode: str, response: SearchResult) -> str | None:
+    """Returns the cursor of the page after the response, or None on the last page."""
+    if not response.has_more:
+        return None
+    cursor = {"offset": response.offset + len(response), "top_n": len(response), "search": query_hash(req.query, mode)}
+    return base64.urlsafe_b64encode(json.dumps(cursor).encode("utf-8")).decode("ascii")
+
+
+def get_engine(request: Request) -> SearchEngine:
+    """
+    Returns the process-wide search engine created in the application lifespan.
+
+    Raises
+    ------
+    HTTPException
+        If the engine is still loading its models and indexes.
+    """
+    engine: SearchEngine | None = getattr(request.app.state, "engine", None)
+    if engine is None or not engine.ready:
+        raise HTTPException(status_code=503, detail="Search engine is still loading")
+    return engine
 
 
 @Router.post("/profiles/long")  # The endpoint for getting profiles
-async def get_profiles(req: ProfileRequest) -> dict:
+async def get_profiles(req: ProfileRequest, engine: SearchEngine = Depends(get_engine)) -> dict:
     """
     Returns the profiles for the specified query.
 
     Parameters
     ----------
     req : ProfileRequest
-        The request containing the query.
+        The request containing the query and the page to return.
+    engine : SearchEngine
+        The shared search engine.
 
     Returns
     -------
@@ -41,28 +110,27 @@ async def get_profiles(req: ProfileRequest) -> dict:
         The profiles for the specified query.
     """
     logging.info("POST /profiles/long")
+    offset, top_n = get_page(req, "long")
     try:
-        db = Database()
-        # Create a search engine instance
-        engine = SearchEngine(db=db, open_ai_key=OPENAI_API_KEY)
-        response = await engine.long_search(req.query, 10)
+        response = await engine.long_search(req.query, top_n, offset=offset)
         # Convert the profiles to dictionaries to become serialized
-        profiles = [profile.to_dict() for profile in response]
-        return {"profiles": profiles, "code": 200}
+        return {**response.to_dict(), "next_cursor": next_cursor(req, "long", response), "code": 200}
 
     except Exception as e:
         logging.error(e)
         return {"error": e, "code": 500}
     
 @Router.post("/profiles/quick")  # The endpoint for getting profiles
-async def get_profiles(req: ProfileRequest) -> dict:
+async def get_profiles(req: ProfileRequest, engine: SearchEngine = Depends(get_engine)) -> dict:
     """
     Returns the profiles for the specified query.
 
     Parameters
     ----------
     req : ProfileRequest
-        The request containing the query.
+        The request containing the query and the page to return.
+    engine : SearchEngine
+        The shared search engine.
 
     Returns
     -------
@@ -70,28 +138,27 @@ async def get_profiles(req: ProfileRequest) -> dict:
         The profiles for the specified query.
     """
     logging.info("POST /profiles/quick")
+    offset, top_n = get_page(req, "quick")
     try:
-        db = Database()
-        # Create a search engine instance
-        engine = SearchEngine(db=db, open_ai_key=OPENAI_API_KEY)
-        response = await engine.quick_search(req.query, 30)
+        response = await engine.quick_search(req.query, top_n, offset=offset)
         # Convert the profiles to dictionaries to become serialized
-        profiles = [profile.to_dict() for profile in response]
-        return {"profiles": profiles, "code": 200}
+        return {**response.to_dict(), "next_cursor": next_cursor(req, "quick", response), "code": 200}
 
     except Exception as e:
         logging.error(e)
         return {"error": e, "code": 500}
     
 @Router.post("/profiles/norm")  # The endpoint for getting profiles
-async def get_profiles(req: ProfileRequest) -> dict:
+async def get_profiles(req: ProfileRequest, engine: SearchEngine = Depends(get_engine)) -> dict:
     """
     Returns the profiles for the specified query.
 
     Parameters
     ----------
     req : ProfileRequest
-        The request containing the query.
+        The request containing the query and the page to return.
+    engine : SearchEngine
+        The shared search engine.
 
     Returns
     -------
@@ -99,21 +166,154 @@ async def get_profiles(req: ProfileRequest) -> dict:
         The profiles for the specified query.
     """
     logging.info("POST /profiles/norm")
+    offset, top_n = get_page(req, "norm")
     try:
-        db = Database()
-        # Create a search engine instance
-        engine = SearchEngine(db=db, open_ai_key=OPENAI_API_KEY)
-        response = await engine.search(req.query, 20)
+        response = await engine.search(req.query, top_n, offset=offset)
         # Convert the profiles to dictionaries to become serialized
-        profiles = [profile.to_dict() for profile in response]
-        return {"profiles": profiles, "code": 200}
+        return {**response.to_dict(), "next_cursor": next_cursor(req, "norm", response), "code": 200}
 
     except Exception as e:
         logging.error(e)
         return {"error": e, "code": 500}
     
+@Router.post("/profiles/fts")  # The endpoint for getting profiles
+async def get_profiles(req: ProfileRequest, engine: SearchEngine = Depends(get_engine)) -> dict:
+    """
+    Returns the profiles for the specified query, ranked by the BM25 full-text index.
+
+    Parameters
+    ----------
+    req : ProfileRequest
+        The request containing the query and the page to return.
+    engine : SearchEngine
+        The shared search engine.
+
+    Returns
+    -------
+    dict
+        The profiles for the specified query.
+    """
+    logging.info("POST /profiles/fts")
+    offset, top_n = get_page(req, "fts")
+    try:
+        response = await engine.fts_search(req.query, top_n, offset=offset)
+        # Convert the profiles to dictionaries to become serialized
+        return {**response.to_dict(), "next_cursor": next_cursor(req, "fts", response), "code": 200}
+
+    except Exception as e:
+        logging.error(e)
+        return {"error": e, "code": 500}
+    
+@Router.post("/profiles/{mode}/stream")  # The endpoint for streaming profiles
+async def stream_profiles(mode: str, req: ProfileRequest, engine: SearchEngine = Depends(get_engine)) -> StreamingResponse:
+    """
+    Streams the profiles for the specified query as newline-delimited JSON.
+
+    Every line is one ranking: the `stage` that just finished, whether the ranking is
+    `final`, and the profiles fused over the stages finished so far. The last line is
+    the final ranking, or an error.
+
+    Parameters
+    ----------
+    mode : str
+        The search mode: fts, quick, norm or long.
+    req : ProfileRequest
+        The request containing the query and the page to return.
+    engine : SearchEngine
+        The shared search engine.
+
+    Returns
+    -------
+    StreamingResponse
+        The rankings, one JSON object per line.
+    """
+    logging.info(f"POST /profiles/{mode}/stream")
+    if mode not in TOP_N:
+        raise HTTPException(status_code=404, detail=f"Unknown search mode {mode}")
+    offset, top_n = get_page(req, mode)
+
+    async def events():
+        try:
+            async for stage, response in engine.stream_search(req.query, mode, top_n, offset=offset):
+                yield json.dumps({**response.to_dict(), "stage": stage, "final": stage == "final",
+                                  "next_cursor": next_cursor(req, mode, response), "code": 200}) + "\n"
+        except Exception as e:
+            logging.error(e)
+            yield json.dumps({"error": str(e), "final": True, "code": 500}) + "\n"
+
+    return StreamingResponse(events(), media_type="application/x-ndjson")
+
+
+@Router.post("/profiles/batch")  # The endpoint for searching many queries at once
+async def batch_profiles(req: BatchRequest, engine: SearchEngine = Depends(get_engine)) -> StreamingResponse:
+    """
+    Streams the profiles for many queries as newline-delimited JSON, one line per query.
+
+    Lines arrive as the queries finish, not in request order. Each carries the `index`
+    of its query in the request and the query itself. The batch waits for every ranking
+    stage, as it is meant for offline jobs.
+
+    Parameters
+    ----------
+    req : BatchRequest
+        The queries and the search mode.
+    engine : SearchEngine
+        The shared search engine.
+
+    Returns
+    -------
+    StreamingResponse
+        The result of every query, one JSON object per line.
+    """
+    logging.info(f"POST /profiles/batch ({len(req.queries)} queries)")
+    if req.mode not in TOP_N:
+        raise HTTPException(status_code=422, detail=f"Unknown search mode {req.mode}")
+    if len(req.queries) > MAX_BATCH_QUERIES:
+        raise HTTPException(status_code=413, detail=f"A batch holds at most {MAX_BATCH_QUERIES} queries")
+
+    async def events():
+        try:
+            async for index, response in engine.search_many(req.queries, req.mode, req.top_n or TOP_N[req.mode]):
+                yield json.dumps({**response.to_dict(), "index": index, "query": req.queries[index], "code": 200}) + "\n"
+        except Exception as e:
+            logging.error(e)
+            yield json.dumps({"error": str(e), "code": 500}) + "\n"
+
+    return StreamingResponse(events(), media_type="application/x-ndjson")
+
 
 @Router.get("/ping")
 async def ping() -> dict:
     logging.info("GET /ping")
     return {"message": "pong", "code": 200}
+
+
+@Router.get("/admin/keywords")
+async def keyword_cache_stats(engine: SearchEngine = Depends(get_engine)) -> dict:
+    """
+    Returns the hit and miss counters of the keyword cache.
+    """
+    logging.info("GET /admin/keywords")
+    return {"keyword_cache": engine.keyword_cache.stats(), "code": 200}
+
+
+@Router.get("/admin/cache")
+async def response_cache_stats(engine: SearchEngine = Depends(get_engine)) -> dict:
+    """
+    Returns the size, corpus version and counters of the search response cache.
+    """
+    logging.info("GET /admin/cache")
+    return {"response_cache": engine.response_cache.stats(), "code": 200}
+
+
+@Router.get("/ready")
+async def ready(request: Request, response: Response) -> dict:
+    """
+    Reports whether the search engine has loaded its models and indexes.
+    """
+    logging.info("GET /ready")
+    engine: SearchEngine | None = getattr(request.app.state, "engine", None)
+    if engine is None or not engine.ready:
+        response.status_code = 503
+        return {"message": "loading", "code": 503}
+    return {"message": "ready", "code": 200}
@@ -1,12 +1,21 @@
 import json
-import httpx
+import time
+import asyncio
+import logging
+from typing import AsyncIterator
+from urllib.parse import urlsplit
 from bs4 import BeautifulSoup
 
+from .HttpClient import HttpClient
+
 __all__ = ['Scraper']
 
 
 class Scraper:
-    def __init__(self) -> None:
+    def __init__(self, client: HttpClient | None = None, concurrency: int = 5) -> None:
+        self.__client = client  # The shared HTTP client. A one-off client is used per scrape if None
+        self.concurrency = concurrency  # Maximum listing pages fetched at once
+        self.stats: dict[str, dict] = {}  # {listing url: {'seconds', 'links', 'new', 'errors'}} of the last scrape
         try:
             with open('links.json', 'r') as file:
                 self.__urls = json.load(file)["urls"]
@@ -14,12 +23,11 @@ class Scraper:
         except FileNotFoundError:
             self.__urls = []
         
-    async def __get_soup(self, url: str) -> BeautifulSoup:
+    async def __get_soup(self, client: HttpClient, url: str) -> BeautifulSoup:
         """
         Returns a BeautifulSoup object from the given URL.
         """
-        async with httpx.AsyncClient() as client:
-            response = await client.get(url)
+        response = await client.get(url)
         return BeautifulSoup(response.text, 'html.parser')
     
     def __get_links(self, soup: BeautifulSoup) -> list:
@@ -35,35 +43,100 @@ class Scraper:
                 if 'www.imperial.ac.uk/people/' in academic_url:
                     # Fix the URL if it doesn't start with 'https://www'
                     academic_url = "https://www"+"".join(academic_url.split('www')[1:])
-                    links.append(academic_url)
+                    links.append(Scraper.normalise(academic_url))
 
             except Exception:
                 pass
 
         return links
+
+    @staticmethod
+    def normalise(url: str) -> str:
+        """
+        Returns the profile URL without its query string and fragment, and with a lowercase host.
+        """
+        parts = urlsplit(url.strip())
+        return f"https://{parts.netloc.lower()}{parts.path}"
+
+    @staticmethod
+    def dedupe_key(url: str) -> str:
+        """
+        Returns the key under which two spellings of the same profile URL are the same.
+
+        A trailing slash and the case of the path are ignored. The URL itself is kept as
+        first seen, so profiles already stored under either form keep their key.
+        """
+        return url.rstrip('/').lower()
+
+    async def __scrape_listing(self, client: HttpClient, semaphore: asyncio.Semaphore, url: str) -> tuple[str, list]:
+        """
+        Returns the listing URL and its profile URLs, recording its timing and errors.
+        """
+        stats = self.stats[url]
+        async with semaphore:
+            start = time.perf_counter()
+            try:
+                # Get the BeautifulSoup object from the URL
+                soup = await self.__get_soup(client, url)
+                links = self.__get_links(soup)
+            except Exception as exc:
+                stats['errors'] += 1
+                logging.warning(f"Listing page failed: {url} ({type(exc).__name__}: {exc})")
+                links = []
+            stats['seconds'] = time.perf_counter() - start
+        stats['links'] = len(links)
+        return url, links
+
+    async def stream(self) -> AsyncIterator[str]:
+        """
+        Yields unique academic profile URLs as the listing pages are fetched.
+
+        The listing pages are fetched concurrently, at most `concurrency` at a time, and
+        each page's profile URLs are yielded as soon as it arrives, so the caller can start
+        on the profiles before every department has been scraped. Per-department timing
+        and error counts are kept in `stats`.
+        """
+        self.stats = {url: {'seconds': 0.0, 'links': 0, 'new': 0, 'errors': 0} for url in self.__urls}
+        seen = set()
+        client = self.__client or HttpClient()
+        semaphore = asyncio.Semaphore(self.concurrency)
+        tasks = [asyncio.create_task(self.__scrape_listing(client, semaphore, url)) for url in self.stats]
+        try:
+            for task in asyncio.as_completed(tasks):
+                url, links = await task
+                for link in links:
+                    key = Scraper.dedupe_key(link)
+                    if key not in seen:
+                        seen.add(key)
+                        self.stats[url]['new'] += 1
+                        yield link
+        finally:
+            for task in tasks:
+                task.cancel()
+            if client is not self.__client:
+                await client.close()
+
+    def log_stats(self):
+        """
+        Logs the timing, link and error counts of each listing page of the last scrape.
+        """
+        for url, stats in sorted(self.stats.items(), key=lambda item: -item[1]['seconds']):
+            logging.info(f"{url}: {stats['seconds']:.2f} s, {stats['links']} links, "
+                         f"{stats['new']} new, {stats['errors']} errors")
+        errors = sum(stats['errors'] for stats in self.stats.values())
+        if errors:
+            logging.warning(f"{errors} of {len(self.stats)} listing pages failed")
     
     async def scrape(self) -> list:
         """
-        Returns a list of academic profile URLs.
+        Returns a sorted list of unique academic profile URLs.
         """
-        profiles = []
-        async with httpx.AsyncClient() as client:
-            for url in self.__urls:
-                try:
-                    # Get the BeautifulSoup object from the URL
-                    soup = await self.__get_soup(url)
-                    links = self.__get_links(soup)
-                    profiles.extend(links)
-                
-                except Exception:
-                    pass
-
+        profiles = [url async for url in self.stream()]
         profiles.sort()
         return profiles
 
 
 if __name__ == "__main__":
-    import asyncio
     
     async def main():
         scraper = Scraper()
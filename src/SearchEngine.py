@@ -1,37 +1,162 @@
 import asyncio
 import logging
-from typing import List
-from collections import Counter
+from typing import AsyncIterator, List
 
 from openai import OpenAI
-from sklearn.feature_extraction.text import TfidfVectorizer
-from sklearn.metrics.pairwise import cosine_similarity
 import numpy as np
-import torch
-from transformers import AutoTokenizer, AutoModel
-from scipy.spatial.distance import cosine as cosine_distance
 
-from src.Profile import Profile
 from src.Database import Database
+from src.Corpus import Corpus
+from src.TfidfIndex import TfidfIndex
+from src.KeywordMatcher import KeywordMatcher
+from src.KeywordCache import KeywordCache
+from src.SearchResult import SearchResult
+from src.Ranking import Ranking
+from src.RankFusion import RankFusion
+from src.EmbeddingIndex import EmbeddingIndex
+from src.VectorIndex import VectorIndex
+from src.Encoder import Encoder
+from src.QueryBatcher import QueryBatcher
+from src.ResponseCache import ResponseCache
 
 class SearchEngine:
-    def __init__(self, db: Database, open_ai_key: str):
+    # Default weight of each ranking stage in the fused score, by search mode
+    FUSION_WEIGHTS = {
+        'quick': {'keywords': 1.0},
+        'norm': {'keywords': 1.0, 'tfidf': 2.0},
+        'long': {'keywords': 1.0, 'tfidf': 1.0, 'bert': 1.0},
+        'fts': {'bm25': 1.0}
+    }
+    # The ranking stages run by each search mode
+    MODE_STAGES = {
+        'quick': ('keywords',),
+        'norm': ('keywords', 'tfidf'),
+        'long': ('keywords', 'tfidf', 'bert'),
+        'fts': ('bm25',)
+    }
+    BATCH_CONCURRENCY = 8  # Per-query stages, such as the OpenAI call, run at once by a batch search
+
+    def __init__(self, db: Database, open_ai_key: str, tfidf_path: str | None = None, persist_keywords: bool = False,
+                 deadline: float = 10.0, vector_index: str = 'exact', vector_index_params: dict | None = None,
+                 vector_candidates: int = 100, encoder: str = 'torch', encoder_agreement: float = 0.99,
+                 response_cache_bytes: int = 32 * 1024 * 1024):
         self.__db: Database = db  # The database instance for the engine instance
         self.__openai_key = open_ai_key
         self.__client = OpenAI(api_key=self.__openai_key)  # The OpenAI client for the engine instance
         self.__seed = 42
-        # Initialize the TF-IDF vectorizer
-        self.__vectorizer = TfidfVectorizer(stop_words='english')
-        # Initialize the BERT model and tokenizer
-        self.device = 'cuda' if torch.cuda.is_available() else 'cpu'
-        self.tokenizer = AutoTokenizer.from_pretrained('sentence-transformers/all-MiniLM-L6-v2')
-        self.model = AutoModel.from_pretrained('sentence-transformers/all-MiniLM-L6-v2').to(self.device)
+        # The completion parameters, also part of the keyword cache key
+        self.__completion_params = {
+            'model': "gpt-3.5-turbo-16k-0613",  # gpt-3.5-turbo-16k-0613 is fast and returns good results
+            'seed': self.__seed,
+            'temperature': 1.2,
+            'max_tokens': 50,
+            'top_p': 1.0,
+            'frequency_penalty': 0.2,
+            'presence_penalty': 0.2
+        }
+        self.__keyword_prompt = "Understand the topic of the query and generate 50 relevant keywords in a comma-separated list."
+        # Cache of generated keywords, optionally persisted in the database
+        self.keyword_cache = KeywordCache(db=self.__db if persist_keywords else None)
+        # Cache of complete search results, dropped when the corpus changes
+        self.response_cache = ResponseCache(max_bytes=response_cache_bytes)
+        # The fitted TF-IDF index, rebuilt in the background when the corpus changes
+        self.__tfidf: TfidfIndex | None = None
+        self.__tfidf_path = tfidf_path  # Where the TF-IDF index is saved, if anywhere
+        self.__tfidf_task: asyncio.Task | None = None
+        self.__corpus: tuple[int, Corpus] | None = None  # The last corpus and the database version it was built at
+        self.__matcher: KeywordMatcher | None = None  # Lower-cased corpus for keyword counting
+        # Initialize the BERT encoder on the configured backend, see Encoder
+        self.encoder = Encoder(backend=encoder)
+        self.encoder_agreement = encoder_agreement  # Minimum cosine with the fp32 embeddings an optimised encoder must reach
+        # Stored profile embeddings, re-embedded only when a profile changes
+        self.__embeddings = EmbeddingIndex(self.__db, self.__embed_texts, tag=self.encoder.tag)
+        # Concurrent query embeddings share one forward pass
+        self.query_batcher = QueryBatcher(self.__embed_texts)
+        # Nearest-neighbour search over the embeddings, rebuilt when the embedding matrix changes
+        self.__vector_kind = vector_index  # 'exact' or 'ivf', see VectorIndex
+        self.__vector_params = vector_index_params or {}
+        # The index with the matrix and profile URLs it was built on
+        self.__vector_index: tuple[np.ndarray, tuple[str, ...], VectorIndex] | None = None
+        self.__vector_task: asyncio.Task | None = None  # Retrains an approximate index in the background
+        self.__vector_rows: tuple[np.ndarray, np.ndarray] | None = None  # A newer matrix and its rows in the served index
+        self.__vector_lock = asyncio.Lock()
+        self.vector_candidates = vector_candidates  # Profiles scored by an approximate index per query
+        self.fusion_weights = {mode: dict(weights) for mode, weights in self.FUSION_WEIGHTS.items()}
+        self.deadline = deadline  # Default seconds a search waits for its ranking stages
+        self.ready = False  # Set once the models are loaded and the indexes are built
         logging.info("Async Search Engine initialized")
 
-    async def __query_to_keywords(self, query: str, recursive: int = 0, recursive_max: int= 3) -> list[str]:
+    async def warm_up(self):
+        """
+        Builds the search indexes and runs one forward pass so the first request does not pay for it.
+        """
+        logging.info("Warming up the search engine")
+        corpus = await self.__get_corpus()
+        await self.__get_tfidf(corpus)
+        await self.__validate_encoder(corpus)
+        await self.__get_vector_index(corpus, await self.__embeddings.sync(corpus))
+        await self.__embed_text("warm up")
+        self.ready = True
+        logging.info("Search engine ready")
+
+    async def __validate_encoder(self, corpus: Corpus, sample_size: int = 64):
+        """
+        Checks an optimised encoder against the fp32 model on a sample of profiles.
+
+        If any sampled embedding has a cosine below `encoder_agreement` with its fp32
+        counterpart, the engine falls back to the fp32 encoder.
+        """
+        if self.encoder.backend == 'torch':
+            return
+        loop = asyncio.get_running_loop()
+        reference = await loop.run_in_executor(None, lambda: Encoder(self.encoder.model_name, backend='torch'))
+        cosines = await loop.run_in_executor(None, self.encoder.agreement, reference, corpus.documents[:sample_size])
+        if len(cosines) == 0:
+            return
+        logging.info(f"Encoder {self.encoder.backend} agrees with fp32: mean cosine {cosines.mean():.4f}, minimum {cosines.min():.4f}")
+        if cosines.min() < self.encoder_agreement:
+            logging.warning(f"Encoder {self.encoder.backend} is below the {self.encoder_agreement} cosine agreement, "
+                            "falling back to the fp32 encoder")
+            self.encoder = reference
+            self.__embeddings = EmbeddingIndex(self.__db, self.__embed_texts, tag=self.encoder.tag)
+
+    async def __get_corpus(self) -> Corpus:
+        """
+        Returns a snapshot of the profiles in the database.
+
+        The corpus is rebuilt only when the database version changed since the last call.
+        """
+        version, profiles = await self.__db.get_snapshot()
+        if self.__corpus is None or self.__corpus[0] != version:
+            loop = asyncio.get_running_loop()
+            self.__corpus = (version, await loop.run_in_executor(None, Corpus, profiles))
+        return self.__corpus[1]
+
+    async def __query_to_keywords(self, query: str) -> list[str]:
         """
         This function takes a query and returns a list of keywords that are relevant to the query.
 
+        Keywords are served from the keyword cache when possible, and concurrent identical
+        queries share one OpenAI call.
+
+        Parameters
+        ----------
+        query : str
+            The query to convert to keywords.
+        
+        Returns
+        -------
+        list[str]
+            A list of keywords that are relevant to the query.
+        """
+        params = {**self.__completion_params, 'prompt': self.__keyword_prompt}
+        key = KeywordCache.make_key(query, params)
+        return await self.keyword_cache.get(key, lambda: self.__fetch_keywords(query))
+
+    async def __fetch_keywords(self, query: str, recursive: int = 0, recursive_max: int= 3) -> list[str]:
+        """
+        This function asks the OpenAI API for a list of keywords that are relevant to the query.
+
         Parameters
         ----------
         query : str
@@ -53,17 +178,11 @@ class SearchEngine:
             # Run in executor needs to be called with the current event loop
             loop = asyncio.get_running_loop()
             response = await loop.run_in_executor(None, lambda: self.__client.chat.completions.create(
-                model="gpt-3.5-turbo-16k-0613",  # gpt-3.5-turbo-16k-0613 is fast and returns good results
-                seed=self.__seed,
-                temperature=1.2,
-                max_tokens=50,
-                top_p=1.0,
-                frequency_penalty=0.2,
-                presence_penalty=0.2,
+                **self.__completion_params,
                 messages=[
                     # This message returns a list of keywords based on the query
                     {"role": "system",
-                     "content": "Understand the topic of the query and generate 50 relevant keywords in a comma-separated list."},
+                     "content": self.__keyword_prompt},
                     {"role": "user",
                      "content": query}
                 ]
@@ -75,220 +194,628 @@ class SearchEngine:
                 return keywords
             else:
                 logging.error("Unexpected response format from OpenAI API.")
-                return await self.__query_to_keywords(query, recursive=recursive + 1)
+                return await self.__fetch_keywords(query, recursive=recursive + 1)
         except Exception as e:
             logging.error(f"Error with OpenAI API: {e}")
             return []
 
-    async def __rank_by_keywords(self, profiles: List[Profile], keywords: List[str]) -> List[Profile]:
+    async def __get_matcher(self, corpus: Corpus) -> KeywordMatcher:
+        """
+        Returns the keyword matcher for the corpus, building it when the corpus version changes.
+        """
+        if self.__matcher is None or self.__matcher.version != corpus.version:
+            loop = asyncio.get_running_loop()
+            self.__matcher = await loop.run_in_executor(None, KeywordMatcher, corpus)
+        return self.__matcher
+
+    async def __rank_by_keywords(self, corpus: Corpus, keywords: List[str], memo: dict | None = None) -> np.ndarray:
         """
-        This function ranks the profiles based on the number of keywords found in the profile text.
+        This function scores the profiles by the number of keywords found in the profile text.
 
         Parameters
         ----------
-        profiles : List[Profile]
-            The list of profiles to rank.
+        corpus : Corpus
+            The profiles to score.
         keywords : List[str]
-            The list of keywords to rank the profiles by.
+            The list of keywords to score the profiles by.
+        memo : dict | None
+            The documents found for each keyword, shared by the queries of a batch.
         
         Returns
         -------
-        List[Profile]
-            A list of profiles ranked by the number of keywords found in the profile text.
+        np.ndarray
+            The number of keywords found in each profile, in corpus order.
         """
-        ranked_profiles = []
-        # Set the keyword count for each profile
-        for profile in profiles:
-            try:
-                profile_text = str(profile)
-                keyword_count = sum(keyword.lower() in profile_text.lower() for keyword in keywords)
-                ranked_profiles.append((profile, keyword_count))
-            except Exception as e:
-                logging.error(f"Error while ranking profile: {profile.get_data('url')} - {e}")
+        matcher = await self.__get_matcher(corpus)
+        # Count the keywords found in every profile in one go
+        keyword_counts = await asyncio.get_running_loop().run_in_executor(None, matcher.count, keywords, memo)
+        return keyword_counts.astype(np.float64)
 
-        # Sort the profiles by the number of keywords found in the profile text
-        # Sorting in descending order on the second index of the tuple
-        ranked_profiles.sort(key=lambda x: x[1], reverse=True)
-        # Return just the profiles
-        return [profile for profile, _ in ranked_profiles]
-
-    async def __simple_rank(self, query: str, top_n: int = 10) -> List[Profile]:
+    async def __simple_rank(self, corpus: Corpus, query: str, memo: dict | None = None) -> np.ndarray:
         """
-        This is a simple ranking function that ranks profiles based on the number of keywords found in the profile text.
+        This is a simple ranking function that scores profiles by the number of keywords found in the profile text.
 
         Parameters
         ----------
+        corpus : Corpus
+            The snapshot of the profiles to rank.
         query : str
             The query to search for.
-        top_n : int
-            The number of profiles to return.
+        memo : dict | None
+            The documents found for each keyword, shared by the queries of a batch.
 
         Returns
         -------
-        List[Profile]
-            A list of profiles ranked by the number of keywords found in the profile text.
+        np.ndarray
+            The keyword count of each profile, in corpus order.
         """
         logging.info(f"Simple Ranking for: {query}")
         # Get the keywords from the query
         keywords = await self.__query_to_keywords(query)
-        # Get the profiles from the database
-        profiles = await self.__db.get_profiles()
-        # Rank the profiles by the keywords
-        ranked_profiles = await self.__rank_by_keywords(profiles, keywords)
-        # Return the top n profiles
-        return ranked_profiles[:top_n]
+        # Score the profiles by the keywords
+        return await self.__rank_by_keywords(corpus, keywords, memo)
     
-    async def __compute_tfidf_matrix(self, documents: List[str]):
+    def __fit_tfidf(self, corpus: Corpus) -> TfidfIndex:
         """
-        Asynchronously compute the TF-IDF matrix for a list of documents.
+        Fits a TF-IDF index on the corpus and saves it to disk if a path is configured.
         """
-        loop = asyncio.get_event_loop()
-        tfidf_matrix = await loop.run_in_executor(None, lambda: self.__vectorizer.fit_transform(documents))
-        return tfidf_matrix
+        index = TfidfIndex.fit(corpus)
+        if self.__tfidf_path:
+            try:
+                index.save(self.__tfidf_path)
+            except Exception as e:
+                logging.error(f"Could not save TF-IDF index to {self.__tfidf_path}: {e}")
+        return index
 
-    async def __compute_query_vector(self, query: str):
+    async def __rebuild_tfidf(self, corpus: Corpus):
         """
-        Asynchronously compute the TF-IDF vector for a search query.
+        Rebuilds the TF-IDF index in the background and swaps it in when done.
         """
-        loop = asyncio.get_event_loop()
-        query_vector = await loop.run_in_executor(None, lambda: self.__vectorizer.transform([query]))
-        return query_vector
-    
-    async def __tf_idf_rank(self, query: str, top_n: int = 25) -> List[Profile]:
+        try:
+            loop = asyncio.get_running_loop()
+            self.__tfidf = await loop.run_in_executor(None, self.__fit_tfidf, corpus)
+        except Exception as e:
+            logging.error(f"Error while rebuilding the TF-IDF index: {e}")
+
+    async def __get_tfidf(self, corpus: Corpus) -> TfidfIndex:
         """
-        This function ranks profiles based on the cosine similarity between the query and the profile text.
+        Returns the TF-IDF index, scheduling a rebuild if the corpus changed since it was fitted.
+
+        The first call loads the saved index or fits one. Later calls never wait for a
+        rebuild: until it finishes, queries are answered from the previous version.
+        """
+        loop = asyncio.get_running_loop()
+        if self.__tfidf is None and self.__tfidf_path:
+            self.__tfidf = await loop.run_in_executor(None, TfidfIndex.load, self.__tfidf_path)
+        if self.__tfidf is None:
+            self.__tfidf = await loop.run_in_executor(None, self.__fit_tfidf, corpus)
+        elif self.__tfidf.version != corpus.version and (self.__tfidf_task is None or self.__tfidf_task.done()):
+            logging.info("Corpus changed, rebuilding the TF-IDF index")
+            self.__tfidf_task = asyncio.create_task(self.__rebuild_tfidf(corpus))
+        return self.__tfidf
+
+    async def __tf_idf_rank(self, corpus: Corpus, query: str, lagging: set | None = None) -> np.ndarray:
+        """
+        This function scores profiles by the cosine similarity between the query and the profile text.
 
         Parameters
         ----------
+        corpus : Corpus
+            The snapshot of the profiles to rank.
         query : str
             The query to search for.
-        top_n : int
-            The number of profiles to return.
+        lagging : set | None
+            Receives 'tfidf' if the index was built on an older corpus.
         
         Returns
         -------
-        List[Profile]
-            A list of profiles ranked by the cosine similarity between the query and the profile text.
+        np.ndarray
+            The TF-IDF cosine similarity of each profile, in corpus order.
         """
         logging.info(f"TF-IDF Ranking for: {query}")
-        profiles = await self.__db.get_profiles()
+        return (await self.__tf_idf_rank_many(corpus, [query], lagging))[0]
 
-        # Prepare documents for TF-IDF computation
-        documents = [str(profile) for profile in profiles]  # Assuming each profile has a 'summary' attribute
+    async def __tf_idf_rank_many(self, corpus: Corpus, queries: List[str], lagging: set | None = None) -> np.ndarray:
+        """
+        This function scores profiles against several queries with one sparse matrix product.
 
-        # Compute TF-IDF matrix for documents
-        tfidf_matrix = await self.__compute_tfidf_matrix(documents)
+        Parameters
+        ----------
+        corpus : Corpus
+            The snapshot of the profiles to rank.
+        queries : List[str]
+            The queries to search for.
+        lagging : set | None
+            Receives 'tfidf' if the index was built on an older corpus.
 
-        # Compute TF-IDF vector for query
-        query_vector = await self.__compute_query_vector(query)
+        Returns
+        -------
+        np.ndarray
+            A (queries, profiles) array of TF-IDF cosine similarities, profiles in corpus order.
+        """
+        index = await self.__get_tfidf(corpus)
+
+        # One transform and one sparse matrix product for all queries
+        cosine_similarities = await asyncio.get_running_loop().run_in_executor(None, index.similarities_many, queries)
+
+        if index.version == corpus.version:
+            return cosine_similarities
+        if lagging is not None:
+            lagging.add('tfidf')
+
+        # The index lags behind the corpus while it is rebuilt, so rows are matched to profiles by URL.
+        # Profiles added since the last build score zero until the rebuild finishes
+        scores = np.zeros((len(queries), len(corpus)))
+        matched = [(index_row, corpus.positions[url]) for index_row, url in enumerate(index.urls) if url in corpus.positions]
+        if matched:
+            index_rows, positions = map(list, zip(*matched))
+            scores[:, positions] = cosine_similarities[:, index_rows]
+        return scores
+    
+    async def __bm25_rank(self, corpus: Corpus, query: str) -> np.ndarray:
+        """
+        This function scores profiles by the BM25 relevance of the query in the database full-text index.
 
-        # Compute cosine similarity between query vector and document matrix
-        cosine_similarities = await asyncio.get_event_loop().run_in_executor(
-            None, lambda: cosine_similarity(query_vector, tfidf_matrix).flatten()
-        )
+        Parameters
+        ----------
+        corpus : Corpus
+            The snapshot of the profiles to rank.
+        query : str
+            The query to search for.
 
-        # Get indices of profiles sorted by similarity
-        sorted_indices = np.argsort(cosine_similarities)[::-1]
+        Returns
+        -------
+        np.ndarray
+            The BM25 score of each profile, in corpus order. Profiles without a matching word score zero.
+        """
+        logging.info(f"BM25 Ranking for: {query}")
+        matches = await self.__db.search_fts(query)
+
+        # Profiles written after the corpus snapshot was taken are left out
+        scores = np.zeros(len(corpus))
+        for url, score in matches:
+            position = corpus.positions.get(url)
+            if position is not None:
+                scores[position] = score
+        return scores
+
+    async def __embed_text(self, text: str) -> np.ndarray:
+        """
+        Asynchronously generate embeddings for a given piece of text, in one forward pass with concurrent queries.
+        """
+        return await self.query_batcher.embed(text)
 
-        # Select top N profiles
-        top_profile_indices = sorted_indices[:top_n]
+    def __embed_texts(self, texts: List[str]) -> np.ndarray:
+        """
+        Generate embeddings for a batch of texts, using attention-mask-aware mean pooling.
+        """
+        return self.encoder.encode(texts)
 
-        # Return the top N profiles
-        top_profiles = [profiles[index] for index in top_profile_indices]
-        return top_profiles
-    
-    async def __embed_text(self, text: str) -> torch.Tensor:
+    def __build_vector_index(self, corpus: Corpus, matrix: np.ndarray) -> tuple[np.ndarray, tuple[str, ...], VectorIndex]:
         """
-        Asynchronously generate embeddings for a given piece of text.
+        Builds a vector index on an embedding matrix of the corpus.
         """
-        loop = asyncio.get_event_loop()
-        encoded_input = self.tokenizer(text, padding=True, truncation=True, max_length=128, return_tensors='pt').to(self.device)
-        with torch.no_grad():
-            model_output = await loop.run_in_executor(None, lambda: self.model(**encoded_input))
-        embeddings = model_output.last_hidden_state.mean(dim=1)
-        return embeddings
+        return matrix, corpus.urls, VectorIndex.create(self.__vector_kind, matrix, **self.__vector_params)
 
-    async def __calculate_similarity(self, query_embedding: np.ndarray, profile_embedding: np.ndarray) -> float:
+    async def __rebuild_vector_index(self, corpus: Corpus, matrix: np.ndarray):
+        """
+        Retrains the vector index in the background and swaps it in when done.
+        """
         try:
-            cosine_sim = 1 - cosine_distance(query_embedding, profile_embedding)  # Use NumPy arrays for calculation
-            return cosine_sim
+            loop = asyncio.get_running_loop()
+            self.__vector_index = await loop.run_in_executor(None, self.__build_vector_index, corpus, matrix)
+            self.__vector_rows = None
+            logging.info(f"Vector index rebuilt for {len(matrix)} profiles")
         except Exception as e:
-            logging.error(f"Error while calculating similarity: {e}")
-            return -1
-    
-    async def __bert_rank(self, query: str, top_n: int = 25) -> List[Profile]:
+            logging.error(f"Error while rebuilding the vector index: {e}")
+
+    @staticmethod
+    def __map_rows(index_urls: tuple[str, ...], index_matrix: np.ndarray, urls: tuple[str, ...], matrix: np.ndarray,
+                   batch_size: int = 8192) -> np.ndarray:
+        """
+        Returns the row of every profile of a newer matrix in an older one, or -1 if it is new or its embedding changed.
+        """
+        positions = {url: row for row, url in enumerate(index_urls)}
+        rows = np.fromiter((positions.get(url, -1) for url in urls), dtype=np.int64, count=len(urls))
+        if index_matrix.size == 0 or matrix.size == 0:
+            return np.full(len(urls), -1, dtype=np.int64)
+        covered = np.flatnonzero(rows >= 0)
+        # Compared in batches, so no copy of the whole matrix is made
+        for start in range(0, len(covered), batch_size):
+            batch = covered[start:start + batch_size]
+            changed = np.any(index_matrix[rows[batch]] != matrix[batch], axis=1)
+            rows[batch[changed]] = -1
+        return rows
+
+    async def __get_vector_index(self, corpus: Corpus, matrix: np.ndarray) -> tuple[VectorIndex, np.ndarray | None]:
+        """
+        Returns the vector index to search an embedding matrix of the corpus with.
+
+        An exact index has nothing to train and is rebuilt as soon as the matrix changes.
+        An approximate index is retrained in the background instead, and until that
+        finishes the previous index is served: the returned rows give the index row of
+        every profile of the matrix, or -1 for the profiles that are new or changed since.
+        The rows are None when the index is up to date.
+        """
+        async with self.__vector_lock:
+            loop = asyncio.get_running_loop()
+            if self.__vector_index is None or (VectorIndex.KINDS[self.__vector_kind].exact and self.__vector_index[0] is not matrix):
+                self.__vector_index = await loop.run_in_executor(None, self.__build_vector_index, corpus, matrix)
+                self.__vector_rows = None
+            index_matrix, index_urls, index = self.__vector_index
+            if index_matrix is matrix:
+                return index, None
+
+            if self.__vector_task is None or self.__vector_task.done():
+                logging.info("Embeddings changed, rebuilding the vector index")
+                self.__vector_task = asyncio.create_task(self.__rebuild_vector_index(corpus, matrix))
+            if self.__vector_rows is None or self.__vector_rows[0] is not matrix:
+                rows = await loop.run_in_executor(None, self.__map_rows, index_urls, index_matrix, corpus.urls, matrix)
+                self.__vector_rows = (matrix, rows)
+            return index, self.__vector_rows[1]
+
+    def __vector_scores(self, index: VectorIndex, rows: np.ndarray | None, matrix: np.ndarray,
+                        queries: np.ndarray) -> np.ndarray:
+        """
+        Returns the cosine similarity of every query with every row of the matrix.
+
+        The index scores the rows it covers. New and changed profiles of a matrix the index
+        lags behind are scored exactly against the matrix.
+        """
+        scores = index.scores_many(queries, self.vector_candidates)
+        if rows is None:
+            return scores
+        remapped = np.zeros((len(queries), len(matrix)), dtype=np.float32)
+        covered = rows >= 0
+        remapped[:, covered] = scores[:, rows[covered]]
+        fresh = np.flatnonzero(~covered)
+        if len(fresh):
+            queries = np.asarray(queries, dtype=np.float32).reshape(len(queries), -1)
+            norms = np.linalg.norm(queries, axis=1, keepdims=True)
+            remapped[:, fresh] = (queries / np.where(norms > 0, norms, 1)) @ matrix[fresh].T
+        return remapped
+
+    async def __bert_rank(self, corpus: Corpus, query: str, lagging: set | None = None) -> np.ndarray:
         """
-        This function ranks profiles based on the cosine similarity between the query and the profile text using BERT embeddings.
+        This function scores profiles by the cosine similarity between the query and the profile text using BERT embeddings.
 
         Parameters
         ----------
+        corpus : Corpus
+            The snapshot of the profiles to rank.
         query : str
             The query to search for.
-        top_n : int
-            The number of profiles to return.
+        lagging : set | None
+            Receives 'bert' if the vector index was built on older embeddings.
 
         Returns
         -------
-        List[Profile]
-            A list of profiles ranked by the cosine similarity between the query and the profile text using BERT embeddings.
+        np.ndarray
+            The embedding cosine similarity of each profile, in corpus order.
         """
         logging.info(f"BERT Ranking for: {query}")
 
-        # Get all profiles from the database
-        profiles = await self.__db.get_profiles()
-        
+        # Bring the stored embeddings up to date. Only new or changed profiles are embedded
+        matrix = await self.__embeddings.sync(corpus)
+        index, rows = await self.__get_vector_index(corpus, matrix)
+        if rows is not None and lagging is not None:
+            lagging.add('bert')
+
         # Embed the query
         query_embedding = await self.__embed_text(query)
-        query_embedding = query_embedding.detach().cpu().numpy().flatten()  # Ensure detachment, move to CPU, and flatten
-
-        # Create tasks for embedding all profile summaries
-        profile_embedding_tasks = [self.__embed_text(str(profile)) for profile in profiles]
-        profile_embeddings = await asyncio.gather(*profile_embedding_tasks)
 
-        # Detach and move embeddings to CPU, then flatten
-        profile_embeddings = [embedding.detach().cpu().numpy().flatten() for embedding in profile_embeddings]
+        # One matrix-vector product against all profile embeddings, or against the candidates of an approximate index
+        return self.__vector_scores(index, rows, matrix, query_embedding[None, :])[0]
 
-        # Calculate similarity scores in parallel
-        similarity_scores_tasks = [self.__calculate_similarity(query_embedding, profile_embedding) for profile_embedding in profile_embeddings]
-        similarity_scores = await asyncio.gather(*similarity_scores_tasks)
+    async def __bert_rank_many(self, corpus: Corpus, queries: List[str], batch_size: int = 32,
+                               lagging: set | None = None) -> np.ndarray:
+        """
+        This function scores profiles against several queries with BERT embeddings.
 
-        # Associate profiles with their similarity scores
-        profile_similarity_scores = list(zip(profiles, similarity_scores))
+        The queries are embedded in padded batches and, with the exact index, scored with
+        one matrix-matrix product.
 
-        # Sort profiles by similarity score
-        profile_similarity_scores.sort(key=lambda x: x[1], reverse=True)
+        Parameters
+        ----------
+        corpus : Corpus
+            The snapshot of the profiles to rank.
+        queries : List[str]
+            The queries to search for.
+        batch_size : int
+            Queries embedded per forward pass.
+        lagging : set | None
+            Receives 'bert' if the vector index was built on older embeddings.
 
-        # Select top N profiles
-        top_profiles = [profile for profile, _ in profile_similarity_scores[:top_n]]
-        return top_profiles
-    
+        Returns
+        -------
+        np.ndarray
+            A (queries, profiles) array of embedding cosine similarities, profiles in corpus order.
+        """
+        matrix = await self.__embeddings.sync(corpus)
+        index, rows = await self.__get_vector_index(corpus, matrix)
+        if rows is not None and lagging is not None:
+            lagging.add('bert')
+        loop = asyncio.get_running_loop()
+        embeddings = [await loop.run_in_executor(None, self.__embed_texts, queries[start:start + batch_size])
+                      for start in range(0, len(queries), batch_size)]
+        return await loop.run_in_executor(None, self.__vector_scores, index, rows, matrix, np.concatenate(embeddings))
     
-    async def __rank_combined_results(self, combined_results: List[Profile], top_n: int) -> List[Profile]:
+    def __fuse_results(self, corpus: Corpus, mode: str, results: dict, missed: List[str],
+                       lagging: set | None = None) -> Ranking:
         """
-        This function ranks the combined results based on frequency and order of appearance.
+        This function fuses the scores of the finished ranking stages into one score per profile.
 
         Parameters
         ----------
-        combined_results : List[Profile]
-            The combined results from all ranking methods.
-        top_n : int
-            The number of profiles to return.
+        corpus : Corpus
+            The snapshot the stages scored.
+        mode : str
+            The search mode, which selects the fusion weights.
+        results : dict
+            The corpus-aligned scores of each finished stage, by stage name.
+        missed : List[str]
+            The stages that failed or missed the deadline.
+        lagging : set | None
+            The stages that scored on an index built for an older corpus.
 
         Returns
         -------
-        List[Profile]
-            A list of profiles ranked by frequency and order of appearance.
+        Ranking
+            The fused and per-stage scores of every profile, from which pages are cut.
         """
-        profile_frequency = Counter(combined_results)
-        
-        # Sort profiles by frequency and then by earliest appearance
-        ranked_profiles = sorted(
-            profile_frequency.keys(), 
-            key=lambda profile: (-profile_frequency[profile], combined_results.index(profile))
-        )
-        return ranked_profiles[:top_n]
-    
-    async def long_search(self, query: str, top_n: int = 10) -> List[Profile]:
+        stale = [name for name in results if name in (lagging or ())]
+        return Ranking(corpus, results, missed, RankFusion(self.fusion_weights[mode]).fuse(results), stale)
+
+    async def __iterate_stages(self, stages: dict, deadline: float | None) -> AsyncIterator[tuple[str, np.ndarray | None]]:
+        """
+        This function runs ranking stages concurrently and yields each one as it finishes.
+
+        Stages still running at the deadline are cancelled, unless none has finished yet,
+        in which case the first one to finish is awaited so there is always a result.
+        Closing the iterator early cancels the stages still running.
+
+        Parameters
+        ----------
+        stages : dict
+            The stage names mapped to the coroutines to run.
+        deadline : float | None
+            The number of seconds to wait for the stages, or None to wait for all of them.
+
+        Yields
+        ------
+        tuple[str, np.ndarray | None]
+            The name of a stage and its scores, or None if it failed or missed the deadline.
+        """
+        loop = asyncio.get_running_loop()
+        tasks = {asyncio.ensure_future(coroutine): name for name, coroutine in stages.items()}
+        end = None if deadline is None else loop.time() + deadline
+        pending, finished = set(tasks), False
+        try:
+            while pending:
+                timeout = None if end is None else max(end - loop.time(), 0)
+                done, pending = await asyncio.wait(pending, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    if finished:
+                        break
+                    done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                finished = True
+                for task in sorted(done, key=list(tasks).index):
+                    if task.exception() is None:
+                        yield tasks[task], task.result()
+                    else:
+                        logging.error(f"Ranking stage {tasks[task]} failed: {task.exception()}")
+                        yield tasks[task], None
+            for task in sorted(pending, key=list(tasks).index):
+                logging.warning(f"Ranking stage {tasks[task]} missed the {deadline}s deadline")
+                yield tasks[task], None
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    async def __run_stages(self, stages: dict, deadline: float | None) -> tuple[dict, List[str]]:
+        """
+        This function runs ranking stages concurrently and collects the ones that finish before the deadline.
+
+        Parameters
+        ----------
+        stages : dict
+            The stage names mapped to the coroutines to run.
+        deadline : float | None
+            The number of seconds to wait for the stages, or None to wait for all of them.
+
+        Returns
+        -------
+        tuple[dict, List[str]]
+            The results of the finished stages by name, and the names of the stages that failed or missed the deadline.
+        """
+        finished = {}
+        async for name, scores in self.__iterate_stages(stages, deadline):
+            finished[name] = scores
+        # Keep the stage order of the mode rather than the finishing order
+        results = {name: finished[name] for name in stages if finished[name] is not None}
+        missed = [name for name in stages if finished[name] is None]
+        return results, missed
+
+    def __stages(self, mode: str, corpus: Corpus, query: str, lagging: set) -> dict:
+        """
+        Returns the ranking stage coroutines of a search mode, by stage name.
+
+        The stages that score on an index lagging behind the corpus add their name to `lagging`.
+        """
+        rankers = {
+            'keywords': lambda: self.__simple_rank(corpus, query),
+            'tfidf': lambda: self.__tf_idf_rank(corpus, query, lagging),
+            'bert': lambda: self.__bert_rank(corpus, query, lagging),
+            'bm25': lambda: self.__bm25_rank(corpus, query)
+        }
+        return {name: rankers[name]() for name in self.MODE_STAGES[mode]}
+
+    async def __rank(self, mode: str, corpus: Corpus, query: str, deadline: float | None) -> Ranking:
+        """
+        Runs the stages of a search mode concurrently on the same snapshot and fuses their scores.
+        """
+        lagging = set()
+        results, missed = await self.__run_stages(self.__stages(mode, corpus, query, lagging),
+                                                  self.deadline if deadline is None else deadline)
+        return self.__fuse_results(corpus, mode, results, missed, lagging)
+
+    async def __search(self, mode: str, query: str, top_n: int, deadline: float | None, offset: int = 0) -> SearchResult:
+        """
+        Returns a page of the result of a search.
+
+        The ranking comes from the response cache when the corpus has not changed since,
+        so deeper pages of the same search do not run the ranking stages again.
+        """
+        corpus = await self.__get_corpus()
+        key = ResponseCache.make_key(query, mode, corpus.version, self.fusion_weights[mode])
+        ranking = await self.response_cache.get(key, corpus.version, lambda: self.__rank(mode, corpus, query, deadline))
+        return ranking.page(offset, top_n)
+
+    async def stream_search(self, query: str, mode: str = 'long', top_n: int = 10, deadline: float | None = None,
+                            offset: int = 0) -> AsyncIterator[tuple[str, SearchResult]]:
+        """
+        This function searches for profiles and yields a refined ranking each time a ranking stage finishes.
+
+        Cheap stages such as TF-IDF usually finish first, so the first ranking arrives long
+        before the keyword and BERT stages. A complete result is served from and stored in
+        the response cache like the other searches.
+
+        Parameters
+        ----------
+        query : str
+            The query to search for.
+        mode : str
+            The search mode: 'quick', 'norm', 'long' or 'fts'.
+        top_n : int
+            The number of profiles to return.
+        deadline : float | None
+            Seconds to wait for the ranking stages. Defaults to the engine deadline.
+        offset : int
+            The number of better ranked profiles to skip.
+
+        Yields
+        ------
+        tuple[str, SearchResult]
+            The name of the stage that just finished and the ranking fused over the stages
+            finished so far, then 'final' and the complete result with the missed stages.
+        """
+        if mode not in self.MODE_STAGES:
+            raise ValueError(f"Unknown search mode {mode!r}, expected one of {tuple(self.MODE_STAGES)}")
+        logging.info(f"Streaming {mode} Search for: {query}")
+        corpus = await self.__get_corpus()
+        key = ResponseCache.make_key(query, mode, corpus.version, self.fusion_weights[mode])
+        cached = self.response_cache.lookup(key, corpus.version)
+        if cached is not None:
+            yield 'final', cached.page(offset, top_n)
+            return
+
+        lagging = set()
+        stages = self.__stages(mode, corpus, query, lagging)
+        results, missed = {}, []
+        async for name, scores in self.__iterate_stages(stages, self.deadline if deadline is None else deadline):
+            if scores is None:
+                missed.append(name)
+                continue
+            results[name] = scores
+            yield name, self.__fuse_results(corpus, mode, results, []).page(offset, top_n)
+
+        ranking = self.__fuse_results(corpus, mode, {name: results[name] for name in stages if name in results},
+                                      [name for name in stages if name in missed], lagging)
+        self.response_cache.store(key, corpus.version, ranking)
+        yield 'final', ranking.page(offset, top_n)
+
+    async def search_many(self, queries: List[str], mode: str = 'long', top_n: int = 10,
+                          deadline: float | None = None) -> AsyncIterator[tuple[int, SearchResult]]:
+        """
+        This function searches for the profiles of many queries at once and yields each result when it is ready.
+
+        The TF-IDF and BERT stages score all queries together, each with one query-matrix
+        by document-matrix product. Identical queries run once, and their keyword expansions
+        are shared through the keyword cache. Every distinct keyword of the batch is looked
+        up in the profiles once. Queries whose complete result is cached skip ranking.
+
+        Parameters
+        ----------
+        queries : List[str]
+            The queries to search for.
+        mode : str
+            The search mode: 'quick', 'norm', 'long' or 'fts'.
+        top_n : int
+            The number of profiles to return per query.
+        deadline : float | None
+            Seconds to wait for the ranking stages of the whole batch, or None to wait for all of them.
+
+        Yields
+        ------
+        tuple[int, SearchResult]
+            The position of a query in `queries` and its result, in the order they finish.
+        """
+        if mode not in self.MODE_STAGES:
+            raise ValueError(f"Unknown search mode {mode!r}, expected one of {tuple(self.MODE_STAGES)}")
+        logging.info(f"Batch {mode} Search for {len(queries)} queries")
+        loop = asyncio.get_running_loop()
+        end = None if deadline is None else loop.time() + deadline
+        corpus = await self.__get_corpus()
+
+        # Positions of each distinct query, compared like response cache keys
+        positions: dict[str, List[int]] = {}
+        for position, query in enumerate(queries):
+            key = ResponseCache.make_key(query, mode, corpus.version, self.fusion_weights[mode])
+            positions.setdefault(key, []).append(position)
+
+        pending = {}  # The queries to rank, by cache key
+        for key, indices in positions.items():
+            cached = self.response_cache.lookup(key, corpus.version)
+            if cached is None:
+                pending[key] = queries[indices[0]]
+                continue
+            result = cached.page(0, top_n)
+            for position in indices:
+                yield position, result
+        if not pending:
+            return
+
+        # Stages scoring the whole batch at once, and stages run per query
+        texts = list(pending.values())
+        lagging = set()
+        batch_rankers = {'tfidf': lambda: self.__tf_idf_rank_many(corpus, texts, lagging),
+                         'bert': lambda: self.__bert_rank_many(corpus, texts, lagging=lagging)}
+        batch_tasks = {name: asyncio.ensure_future(batch_rankers[name]())
+                       for name in self.MODE_STAGES[mode] if name in batch_rankers}
+        memo = {}  # The documents found for each keyword, shared by the batch
+        query_rankers = {'keywords': lambda query: self.__simple_rank(corpus, query, memo),
+                         'bm25': lambda query: self.__bm25_rank(corpus, query)}
+        limit = asyncio.Semaphore(self.BATCH_CONCURRENCY)
+
+        async def row(name: str, row_index: int) -> np.ndarray:
+            # Shielded so one query missing its deadline does not cancel the stage for the batch
+            return (await asyncio.shield(batch_tasks[name]))[row_index]
+
+        async def limited(coroutine) -> np.ndarray:
+            async with limit:
+                return await coroutine
+
+        async def rank(key: str, row_index: int) -> tuple[str, SearchResult]:
+            stages = {name: row(name, row_index) if name in batch_tasks else limited(query_rankers[name](pending[key]))
+                      for name in self.MODE_STAGES[mode]}
+            results, missed = await self.__run_stages(stages, None if end is None else max(end - loop.time(), 0))
+            ranking = self.__fuse_results(corpus, mode, results, missed, lagging)
+            self.response_cache.store(key, corpus.version, ranking)
+            return key, ranking.page(0, top_n)
+
+        rank_tasks = [asyncio.ensure_future(rank(key, row_index)) for row_index, key in enumerate(pending)]
+        try:
+            for ranked in asyncio.as_completed(rank_tasks):
+                key, result = await ranked
+                for position in positions[key]:
+                    yield position, result
+        finally:
+            # Closing the iterator early stops the queries still ranking
+            for task in [*rank_tasks, *batch_tasks.values()]:
+                task.cancel()
+
+    async def long_search(self, query: str, top_n: int = 10, deadline: float | None = None,
+                          offset: int = 0) -> SearchResult:
         """
         This function searches thoroughly for profiles based on a query.
 
@@ -298,28 +825,22 @@ class SearchEngine:
             The query to search for.
         top_n : int
             The number of profiles to return.
+        deadline : float | None
+            Seconds to wait for the ranking stages. Defaults to the engine deadline.
+        offset : int
+            The number of better ranked profiles to skip, for deeper pages.
         
         Returns
         -------
-        List[Profile]
-            A list of profiles ranked by the number of keywords found in the profile text.
+        SearchResult
+            The profiles ranked by the fused scores of the stages that finished in time.
         """
         logging.info(f"Long Search for: {query}")
-
-        # Parallel execution of ranking methods
-        simple_ranked = await self.__simple_rank(query, top_n)
-        tfidf_ranked = await self.__tf_idf_rank(query, top_n)
-        bert_ranked = await self.__bert_rank(query, top_n)
-
-        # Combine results from all ranking methods
-        combined_results = simple_ranked + tfidf_ranked + bert_ranked
-
-        # Rank combined results based on frequency and order of appearance
-        ranked_profiles = await self.__rank_combined_results(combined_results, top_n)
-
-        return ranked_profiles
+        # Keyword, TF-IDF and BERT ranking, fused with equal weights
+        return await self.__search('long', query, top_n, deadline, offset)
     
-    async def quick_search(self, query: str, top_n: int = 10) -> List[Profile]:
+    async def quick_search(self, query: str, top_n: int = 10, deadline: float | None = None,
+                           offset: int = 0) -> SearchResult:
         """
         This function searches for profiles based on a query.
 
@@ -329,26 +850,21 @@ class SearchEngine:
             The query to search for.
         top_n : int
             The number of profiles to return.
+        deadline : float | None
+            Seconds to wait for the ranking stages. Defaults to the engine deadline.
+        offset : int
+            The number of better ranked profiles to skip, for deeper pages.
         
         Returns
         -------
-        List[Profile]
-            A list of profiles ranked by the number of keywords found in the profile text.
+        SearchResult
+            The profiles ranked by the number of keywords found in the profile text.
         """
         logging.info(f"Quick Search for: {query}")
-
-        # Parallel execution of ranking methods
-        simple_ranked = await self.__simple_rank(query, top_n)
-
-        # Combine results from all ranking methods
-        combined_results = simple_ranked
-
-        # Rank combined results based on frequency and order of appearance
-        ranked_profiles = await self.__rank_combined_results(combined_results, top_n)
-
-        return ranked_profiles
+        return await self.__search('quick', query, top_n, deadline, offset)
     
-    async def search(self, query: str, top_n: int = 10) -> List[Profile]:
+    async def search(self, query: str, top_n: int = 10, deadline: float | None = None,
+                     offset: int = 0) -> SearchResult:
         """
         This function searches for profiles based on a query.
 
@@ -358,22 +874,40 @@ class SearchEngine:
             The query to search for.
         top_n : int
             The number of profiles to return.
+        deadline : float | None
+            Seconds to wait for the ranking stages. Defaults to the engine deadline.
+        offset : int
+            The number of better ranked profiles to skip, for deeper pages.
         
         Returns
         -------
-        List[Profile]
-            A list of profiles ranked by the number of keywords found in the profile text.
+        SearchResult
+            The profiles ranked by the fused keyword and TF-IDF scores of the stages that finished in time.
         """
         logging.info(f"Normal Search for: {query}")
+        # Keyword and TF-IDF ranking. TF-IDF counts twice
+        return await self.__search('norm', query, top_n, deadline, offset)
 
-        # Parallel execution of ranking methods
-        simple_ranked = await self.__simple_rank(query, top_n)
-        tfidf_ranked = await self.__tf_idf_rank(query, top_n)
-
-        # Combine results from all ranking methods
-        combined_results = simple_ranked + tfidf_ranked + tfidf_ranked
+    async def fts_search(self, query: str, top_n: int = 10, deadline: float | None = None,
+                         offset: int = 0) -> SearchResult:
+        """
+        This function searches for profiles with the database full-text index, without the OpenAI call.
 
-        # Rank combined results based on frequency and order of appearance
-        ranked_profiles = await self.__rank_combined_results(combined_results, top_n)
+        Parameters
+        ----------
+        query : str
+            The query to search for.
+        top_n : int
+            The number of profiles to return.
+        deadline : float | None
+            Seconds to wait for the ranking stages. Defaults to the engine deadline.
+        offset : int
+            The number of better ranked profiles to skip, for deeper pages.
 
-        return ranked_profiles
+        Returns
+        -------
+        SearchResult
+            The profiles ranked by the BM25 relevance of the query.
+        """
+        logging.info(f"Full-Text Search for: {query}")
+        return await self.__search('fts', query, top_n, deadline, offset)
@@ -0,0 +1,50 @@
+from typing import List
+
+from .Profile import Profile
+
+__all__ = ['SearchResult']
+
+
+class SearchResult:
+    def __init__(self, profiles: List[Profile], stages: List[str], missed: List[str] | None = None,
+                 scores: List[float] | None = None, stage_scores: List[dict] | None = None,
+                 offset: int = 0, total: int | None = None) -> None:
+        self.profiles = profiles  # The ranked profiles
+        self.stages = stages  # The ranking stages that contributed to the result
+        self.missed = missed or []  # The stages that failed or missed the deadline
+        self.scores = scores or [0.0] * len(profiles)  # The fused score of each profile
+        self.stage_scores = stage_scores or [{} for _ in profiles]  # The raw score of each profile per stage
+        self.offset = offset  # The rank of the first profile, counted from 0
+        self.total = len(profiles) if total is None else total  # The number of ranked profiles across all pages
+
+    def to_dict(self) -> dict:
+        """
+        Returns the search result as a dictionary.
+
+        Each profile carries its fused `score` and its raw per-stage `scores`.
+
+        Returns
+        -------
+        dict
+            The serialised profiles, the contributing and missed stages, the `offset` of
+            the page and the `total` number of ranked profiles.
+        """
+        return {
+            'profiles': [{**profile.to_dict(), 'score': score, 'scores': stage_scores}
+                         for profile, score, stage_scores in zip(self.profiles, self.scores, self.stage_scores)],
+            'stages': self.stages,
+            'missed_stages': self.missed,
+            'offset': self.offset,
+            'total': self.total
+        }
+
+    @property
+    def has_more(self) -> bool:
+        """Whether ranked profiles follow this page."""
+        return self.offset + len(self.profiles) < self.total
+
+    def __len__(self) -> int:
+        return len(self.profiles)
+
+    def __iter__(self):
+        return iter(self.profiles)
@@ -0,0 +1,110 @@
+# Internal imports
+import os
+import pickle
+import logging
+from typing import List
+
+# External imports
+import numpy as np
+from scipy.sparse import csr_matrix
+from sklearn.feature_extraction.text import TfidfVectorizer
+
+# Local imports
+from .Corpus import Corpus
+
+__all__ = ['TfidfIndex']
+
+
+class TfidfIndex:
+    """
+    A fitted TF-IDF vocabulary and the sparse document matrix of one corpus version.
+
+    Rows of the matrix are L2-normalised, so the cosine similarity with a query is a
+    single sparse matrix-vector product.
+    """
+
+    def __init__(self, version: str, urls: tuple[str, ...], vectorizer: TfidfVectorizer, matrix: csr_matrix):
+        self.version = version  # The corpus version the index was fitted on
+        self.urls = urls  # The profile URL of each matrix row
+        self.vectorizer = vectorizer  # The fitted vectorizer
+        self.matrix = matrix  # (documents, terms) CSR matrix
+
+    @classmethod
+    def fit(cls, corpus: Corpus) -> 'TfidfIndex':
+        """
+        Fits the vectorizer on the corpus and builds the document matrix.
+
+        Parameters
+        ----------
+        corpus : Corpus
+            The corpus to index.
+
+        Returns
+        -------
+        TfidfIndex
+            The index for the corpus version.
+        """
+        # The corpus is lower-cased already, so the vectorizer does not do it again
+        vectorizer = TfidfVectorizer(stop_words='english', lowercase=False)
+        matrix = csr_matrix(vectorizer.fit_transform(corpus.lowered)) if len(corpus) else csr_matrix((0, 0))
+        logging.info(f"TF-IDF index built for {len(corpus)} profiles ({matrix.shape[1]} terms)")
+        return cls(corpus.version, corpus.urls, vectorizer, matrix)
+
+    def similarities(self, query: str) -> np.ndarray:
+        """
+        Returns the cosine similarity between the query and every indexed document.
+
+        Parameters
+        ----------
+        query : str
+            The query to score.
+
+        Returns
+        -------
+        np.ndarray
+            One score per row, in the order of `urls`.
+        """
+        return self.similarities_many([query])[0]
+
+    def similarities_many(self, queries: List[str]) -> np.ndarray:
+        """
+        Returns the cosine similarity between every query and every indexed document.
+
+        All queries are transformed together and scored with one sparse matrix product.
+
+        Parameters
+        ----------
+        queries : List[str]
+            The queries to score.
+
+        Returns
+        -------
+        np.ndarray
+            A (queries, rows) array, rows in the order of `urls`.
+        """
+        if self.matrix.shape[0] == 0:
+            return np.zeros((len(queries), 0))
+        if not self.vectorizer.lowercase:
+            queries = [query.lower() for query in queries]
+        query_matrix = self.vectorizer.transform(queries)
+        return (query_matrix @ self.matrix.T).toarray()
+
+    def save(self, path: str):
+        """Saves the index to disk, replacing the file atomically."""
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'wb') as file:
+            pickle.dump(self, file, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: str) -> 'TfidfIndex | None':
+        """Loads an index saved with `save`, or returns None if there is none."""
+        try:
+            with open(path, 'rb') as file:
+                index = pickle.load(file)
+            return index if isinstance(index, cls) else None
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            logging.error(f"Could not load TF-IDF index from {path}: {e}")
+            return None
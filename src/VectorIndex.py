@@ -0,0 +1,214 @@
+# External imports
+import numpy as np
+
+# Local imports
+from .RankFusion import top_k
+
+__all__ = ['VectorIndex', 'ExactIndex', 'IVFIndex']
+
+
+class VectorIndex:
+    """
+    Nearest-neighbour search over the rows of an L2-normalised embedding matrix.
+
+    Subclasses are built from the matrix once and answer many queries. Use
+    `VectorIndex.create(kind, matrix, **params)` to build one by name:
+
+    - 'exact': one matrix-vector product against every row.
+    - 'ivf': an inverted file index, which only scores the rows of the clusters
+      closest to the query. Approximate, and sub-linear in the number of rows.
+    """
+    KINDS: dict[str, type['VectorIndex']] = {}  # Index classes by name, filled by the subclasses
+    exact = True  # Whether `search` always finds the true nearest rows
+
+    def __init_subclass__(cls, kind: str, **kwargs):
+        super().__init_subclass__(**kwargs)
+        VectorIndex.KINDS[kind] = cls
+
+    def __init__(self, matrix: np.ndarray):
+        self.matrix = matrix  # The indexed rows, unit length
+
+    @staticmethod
+    def create(kind: str, matrix: np.ndarray, **params) -> 'VectorIndex':
+        """
+        Builds a vector index of the given kind.
+
+        Parameters
+        ----------
+        kind : str
+            'exact' or 'ivf'.
+        matrix : np.ndarray
+            The L2-normalised rows to index.
+        **params
+            Passed on to the index class.
+
+        Returns
+        -------
+        VectorIndex
+            The built index.
+        """
+        if kind not in VectorIndex.KINDS:
+            raise ValueError(f"Unknown vector index {kind!r}, expected one of {sorted(VectorIndex.KINDS)}")
+        return VectorIndex.KINDS[kind](matrix, **params)
+
+    def __len__(self) -> int:
+        return len(self.matrix)
+
+    @staticmethod
+    def _normalise(query: np.ndarray) -> np.ndarray:
+        """Returns the query as a unit-length float32 vector."""
+        query = np.asarray(query, dtype=np.float32).ravel()
+        norm = np.linalg.norm(query)
+        return query / norm if norm > 0 else query
+
+    def search(self, query: np.ndarray, k: int) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Returns the k rows most similar to the query.
+
+        Parameters
+        ----------
+        query : np.ndarray
+            The query embedding.
+        k : int
+            The number of rows to return.
+
+        Returns
+        -------
+        tuple[np.ndarray, np.ndarray]
+            The row indices and their cosine similarities, best first.
+        """
+        raise NotImplementedError
+
+    def scores(self, query: np.ndarray, k: int) -> np.ndarray:
+        """
+        Returns one cosine similarity per row, for rank fusion.
+
+        Rows outside the k found by `search` get the lowest similarity found, as they
+        rank no higher than it.
+
+        Parameters
+        ----------
+        query : np.ndarray
+            The query embedding.
+        k : int
+            The number of rows to score exactly.
+
+        Returns
+        -------
+        np.ndarray
+            The similarity of every row, in matrix order.
+        """
+        indices, similarities = self.search(query, k)
+        scores = np.full(len(self), similarities.min() if len(similarities) else 0.0, dtype=np.float32)
+        scores[indices] = similarities
+        return scores
+
+    def scores_many(self, queries: np.ndarray, k: int) -> np.ndarray:
+        """
+        Returns the `scores` of several queries at once.
+
+        Parameters
+        ----------
+        queries : np.ndarray
+            A (queries, dim) array of query embeddings.
+        k : int
+            The number of rows to score exactly per query.
+
+        Returns
+        -------
+        np.ndarray
+            A (queries, rows) array of similarities.
+        """
+        if len(queries) == 0:
+            return np.zeros((0, len(self)), dtype=np.float32)
+        return np.stack([self.scores(query, k) for query in queries])
+
+
+class ExactIndex(VectorIndex, kind='exact'):
+    """Brute-force search: one matrix-vector product against every row."""
+
+    def search(self, query: np.ndarray, k: int) -> tuple[np.ndarray, np.ndarray]:
+        similarities = self.scores(query, k)
+        indices = top_k(similarities, k)
+        return indices, similarities[indices]
+
+    def scores(self, query: np.ndarray, k: int) -> np.ndarray:
+        if self.matrix.size == 0:
+            return np.zeros(len(self.matrix), dtype=np.float32)
+        return self.matrix @ self._normalise(query)
+
+
+    def scores_many(self, queries: np.ndarray, k: int) -> np.ndarray:
+        # One matrix-matrix product for the whole batch
+        if self.matrix.size == 0:
+            return np.zeros((len(queries), len(self)), dtype=np.float32)
+        queries = np.asarray(queries, dtype=np.float32).reshape(len(queries), -1)
+        norms = np.linalg.norm(queries, axis=1, keepdims=True)
+        return (queries / np.where(norms > 0, norms, 1)) @ self.matrix.T
+
+
+class IVFIndex(VectorIndex, kind='ivf'):
+    """
+    An inverted file index.
+
+    The rows are clustered with spherical k-means, and each cluster's rows are stored
+    contiguously. A query is compared with the cluster centroids and only the rows of
+    the `probes` closest clusters are scored, so recall trades off against latency
+    through `probes`.
+    """
+    exact = False
+
+    def __init__(self, matrix: np.ndarray, lists: int | None = None, probes: int = 8, iterations: int = 10,
+                 sample: int = 256, seed: int = 42):
+        super().__init__(matrix)
+        n = len(matrix)
+        self.lists = max(1, min(lists or int(np.sqrt(n)), n))  # Number of clusters
+        self.probes = max(1, probes)  # Clusters scored per query
+        if n == 0:
+            self.centroids = np.zeros((0, 0), dtype=np.float32)
+            self.__ids = np.zeros(0, dtype=np.int64)
+            self.__vectors = matrix
+            self.__offsets = np.zeros(1, dtype=np.int64)
+            return
+
+        # Train the centroids on a sample of at most `sample` rows per cluster
+        rng = np.random.default_rng(seed)
+        training = matrix[rng.choice(n, min(n, self.lists * sample), replace=False)]
+        centroids = training[rng.choice(len(training), self.lists, replace=False)].copy()
+        for _ in range(iterations):
+            assignment = self.__assign(training, centroids)
+            # Sum each cluster's rows as one contiguous block
+            order = np.argsort(assignment, kind='stable')
+            counts = np.bincount(assignment, minlength=self.lists)
+            filled = counts > 0
+            sums = np.empty_like(centroids)
+            sums[filled] = np.add.reduceat(training[order], np.cumsum(counts)[filled] - counts[filled])
+            # Clusters left empty are re-seeded with a random training row
+            sums[~filled] = training[rng.choice(len(training), int((~filled).sum()))]
+            norms = np.linalg.norm(sums, axis=1, keepdims=True)
+            norms[norms == 0] = 1.0
+            centroids = sums / norms
+        self.centroids = np.ascontiguousarray(centroids, dtype=np.float32)
+
+        # Store every row in its cluster's contiguous block
+        assignment = self.__assign(matrix, self.centroids)
+        self.__ids = np.argsort(assignment, kind='stable')  # Matrix row of each stored row
+        self.__vectors = np.ascontiguousarray(matrix[self.__ids])
+        self.__offsets = np.concatenate([[0], np.cumsum(np.bincount(assignment, minlength=self.lists))])
+
+    @staticmethod
+    def __assign(rows: np.ndarray, centroids: np.ndarray, batch_size: int = 8192) -> np.ndarray:
+        """Returns the closest centroid of every row, in batches to bound memory."""
+        return np.concatenate([np.argmax(rows[start:start + batch_size] @ centroids.T, axis=1)
+                               for start in range(0, len(rows), batch_size)])
+
+    def search(self, query: np.ndarray, k: int) -> tuple[np.ndarray, np.ndarray]:
+        if len(self) == 0:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float32)
+        query = self._normalise(query)
+        clusters = top_k(self.centroids @ query, self.probes)
+        blocks = [slice(self.__offsets[cluster], self.__offsets[cluster + 1]) for cluster in clusters]
+        ids = np.concatenate([self.__ids[block] for block in blocks])
+        similarities = np.concatenate([self.__vectors[block] @ query for block in blocks])
+        best = top_k(similarities, k)
+        return ids[best], similarities[best]
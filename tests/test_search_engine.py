@@ -0,0 +1,59 @@
+import asyncio
+import shutil
+import types
+
+import numpy as np
+
+import src.SearchEngine
+from src.Database import Database
+from src.Profile import Profile
+from src.SearchEngine import SearchEngine
+
+
+class FakeEncoder:
+    """Stands in for the BERT encoder, which the TF-IDF searches do not use."""
+
+    def __init__(self, *args, **kwargs):
+        self.backend = 'torch'
+        self.tag = 'fake'
+
+    def encode(self, texts):
+        return np.zeros((len(texts), 8), dtype=np.float32)
+
+
+class FakeOpenAI:
+    """Answers every keyword request with the words of the query."""
+
+    def __init__(self, *args, **kwargs):
+        create = lambda **params: types.SimpleNamespace(choices=[types.SimpleNamespace(
+            message=types.SimpleNamespace(content=', '.join(params['messages'][-1]['content'].split())))])
+        self.chat = types.SimpleNamespace(completions=types.SimpleNamespace(create=create))
+
+
+def test_rankings_of_a_lagging_tfidf_index_are_not_cached(tmp_path, monkeypatch):
+    monkeypatch.setattr(src.SearchEngine, 'Encoder', FakeEncoder)
+    monkeypatch.setattr(src.SearchEngine, 'OpenAI', FakeOpenAI)
+    path = str(tmp_path / 'profiles.db')
+    shutil.copy('profiles.db', path)
+    url = 'https://example.org/quarkonium'
+
+    async def main():
+        db = Database(path)
+        await db.create_table()
+        engine = SearchEngine(db, 'key')
+        await engine.search('materials', 5)  # Builds the TF-IDF index
+
+        await db.upsert_profiles([Profile(url, name='New Profile', summary='quarkonium spectroscopy')])
+        lagging = await engine.search('quarkonium', 5)
+        # The index predates the new profile, so it scores zero and the ranking is not cached
+        assert all(scores['tfidf'] == 0.0 for profile, scores in zip(lagging.profiles, lagging.stage_scores)
+                   if profile.url == url)
+        assert engine.response_cache.stats()['size'] == 0
+
+        await engine._SearchEngine__tfidf_task  # The background rebuild started by the lagging search
+        rebuilt = await engine.search('quarkonium', 5)
+        assert rebuilt.profiles[0].url == url
+        assert rebuilt.stage_scores[0]['tfidf'] > 0
+        assert engine.response_cache.stats()['size'] == 1
+
+    asyncio.run(main())